@@ -3,46 +3,128 @@ import networkx as nx
 import numpy as np
 import os
 import json
-from parse.cfg2vec import Cfg2Vec
+import time
+from parse.cfg2vec import Cfg2Vec, VERSION
+from parse.features import GraphDocuments, FORMAT
+# the cfgbuilder package is shared with the repository root on the path, run from cfg2vec/ as
+#   PYTHONPATH=.. python extract_cfg2vec.py
+from cfgbuilder.parse.stream import iterrecords
+from cfgbuilder.parse.CfgCache import CfgCache, digest, versioned
+from cfgbuilder.parse.CfgGraph import CfgGraph
 
 cfgpath = "../dataset/graphlists/filteredcfg_merge_graph.csv"
 xiaorongcfgpath = "../dataset/graphlists/filteredcfg_nomerge_graph.csv"
+cachepath = "../dataset/cache/cfgcache.sqlite"
+labelpath = "../dataset/label_6166.csv"
+wldocspath = "../dataset/cache/wldocs/"
+embeddingspath = "../dataset/cache/embeddings/"
 
 vecfeatuespath = "../dataset/features/cfg2vec/"
 ablationpath = "../dataset/features/ablation/"
+modelspath = "../dataset/models/cfg2vec/"
+# bounds of the path feature search per graph, None keeps every path
+PATH_BUDGET = None
+PATH_DEPTH = None
+PATH_TIME = None
+# processes building the WL/path documents, the embeddings do not depend on it
+FEATURE_WORKERS = os.cpu_count()
+# WL iterations extracted once per graph list, every sweep run up to this many slices the same labels
+MAX_ITERATIONS = 10
+
 os.makedirs(vecfeatuespath, exist_ok=True)
 os.makedirs(ablationpath, exist_ok=True)
 
 
-def generate_graph_embeddings(input_graph_file, output_feature_file, epoch, use_wl, use_path):
-    print(f"--- Generating: {os.path.basename(output_feature_file)} ---")
-    print(f"Params: epoch={epoch}, use_wl={use_wl}, use_path={use_path}")
+_loaded = {}
 
-    data = pd.read_csv(input_graph_file, index_col="address")
-    print(f"Loaded {len(data)} graphs from {os.path.basename(input_graph_file)}")
 
+def load_graphs(input_graph_file):
+    # graph lists are read once per run, the sweep fits the same file many times
+    if input_graph_file in _loaded:
+        return _loaded[input_graph_file]
     graphs = []
     address_map = {}
-
-    for i, ind in enumerate(data.index):
+    fingerprint = []
+    total = 0
+    for ind, (nodes, edges) in iterrecords(input_graph_file, ["nodes", "edges"]):
+        total += 1
+        fingerprint.append(digest("{},{},{}".format(ind, nodes, edges)))
         try:
-            nodelist = json.loads(data.loc[ind, "nodes"])
-            edgelist = json.loads(data.loc[ind, "edges"])
-            g = nx.DiGraph()
-            g.add_nodes_from(nodelist)
-            g.add_edges_from(edgelist)
+            nodelist = json.loads(nodes)
+            edgelist = json.loads(edges)
+            g = CfgGraph.fromlabels(nodelist, edgelist)
             if len(g) > 0:
                 graphs.append(g)
                 address_map[ind] = len(graphs) - 1
         except Exception as e:
             print(f"Warning: Failed to process graph for address {ind}. Error: {e}")
 
+    print(f"Loaded {total} graphs from {os.path.basename(input_graph_file)}")
     print(f"Successfully constructed {len(graphs)} graph objects.")
+    _loaded[input_graph_file] = graphs, address_map, fingerprint
+    return _loaded[input_graph_file]
 
-    model = Cfg2Vec(dimensions=100, wl_iterations=epoch, use_wl=use_wl, use_path=use_path)
-    model.fit(graphs)
-    vecs = model.get_embedding()
-    print("Model fitting finished.")
+
+def graph_documents(model, graphs, fingerprint, path=wldocspath):
+    # WL labels up to MAX_ITERATIONS and the path features, on disk per format, graph list and extraction params
+    key = digest("\n".join(["format {}".format(FORMAT), json.dumps(model.extraction_params(), sort_keys=True)]
+                           + fingerprint))
+    path = os.path.join(path, key)
+    if GraphDocuments.exists(path):
+        try:
+            documents = GraphDocuments.load(path)
+        except ValueError as e:
+            print(f"WL documents cache ignored: {e}")
+            documents = None
+        if documents is not None and documents.meta["max_iterations"] >= model.wl_iterations:
+            print("WL documents loaded from cache.")
+            return documents
+    documents = model.extract(graphs, max(MAX_ITERATIONS, model.wl_iterations))
+    documents.save(path)
+    return documents
+
+
+def generate_graph_embeddings(input_graph_file, output_feature_file, epoch, use_wl, use_path, cache=cachepath):
+    print(f"--- Generating: {os.path.basename(output_feature_file)} ---")
+    print(f"Params: epoch={epoch}, use_wl={use_wl}, use_path={use_path}")
+
+    model = Cfg2Vec(dimensions=100, wl_iterations=epoch, use_wl=use_wl, use_path=use_path,
+                    path_budget=PATH_BUDGET, path_depth=PATH_DEPTH, path_time=PATH_TIME,
+                    feature_workers=FEATURE_WORKERS)
+    graphs, address_map, graphdigests = load_graphs(input_graph_file)
+    # doc2vec is fit on the whole corpus, so the embeddings are only reusable for the
+    # same parameters and the same graphs: the key covers both, the kind the version of the code
+    params = model.get_params()
+    params.pop("feature_workers")
+    params.pop("corpus_dir")
+    fingerprint = [json.dumps(params, sort_keys=True)] + graphdigests
+    kind = versioned("cfg2vec", VERSION)
+
+    with CfgCache(cache or ":memory:") as cache:
+        key = digest("\n".join(fingerprint))
+        # the entry names the .npy file of the embedding
+        vecspath = cache.get(kind, key)
+        if vecspath is None or not os.path.exists(vecspath):
+            model.fit(graphs, graph_documents(model, graphs, graphdigests))
+            truncated = model.get_truncation()
+            if truncated.any():
+                print(f"Path features truncated for {np.count_nonzero(truncated)} graphs, "
+                      f"{int(truncated.sum())} paths left out")
+            vecs = model.get_embedding()
+            vecspath = os.path.join(embeddingspath, key + ".npy")
+            os.makedirs(embeddingspath, exist_ok=True)
+            np.save(vecspath, vecs)
+            cache.put(kind, key, vecspath)
+            print("Model fitting finished.")
+            if getattr(model, "model", None) is not None:
+                # kept for embedding new contracts with Cfg2Vec.load(...).infer
+                modelpath = os.path.join(modelspath, os.path.splitext(os.path.basename(output_feature_file))[0])
+                model.save(modelpath)
+                print(f"Model saved to {modelpath}")
+        else:
+            vecs = np.load(vecspath)
+            print("Embeddings loaded from cache.")
+        cache.report()
 
     veccol = ['vec_' + str(i) for i in range(100)]
     results = []
@@ -57,6 +139,53 @@ def generate_graph_embeddings(input_graph_file, output_feature_file, epoch, use_
     print(f"Features saved to {output_feature_file}\n")
 
 
+def bench_training(input_graph_file=cfgpath, epoch=4, workers=(1, 2, 4, 8)):
+    # Doc2Vec fit throughput per worker count, in-memory documents against a corpus file
+    graphs, address_map, graphdigests = load_graphs(input_graph_file)
+    for corpus_file in (False, True):
+        for w in workers:
+            model = Cfg2Vec(dimensions=100, wl_iterations=epoch, workers=w, corpus_file=corpus_file,
+                            path_budget=PATH_BUDGET, path_depth=PATH_DEPTH, path_time=PATH_TIME,
+                            feature_workers=FEATURE_WORKERS)
+            documents = graph_documents(model, graphs, graphdigests)
+            words = sum(len(doc) for doc in documents.documents(
+                epoch, model.erase_base_features, model.use_wl, model.use_path)) * model.epochs
+            start = time.perf_counter()
+            model.fit(graphs, documents)
+            seconds = time.perf_counter() - start
+            print(f"{'corpus_file' if corpus_file else 'in-memory'} workers={w}: "
+                  f"{seconds:.2f}s, {words / seconds:,.0f} words/s")
+
+
+def vocabulary_report(input_graph_file=cfgpath, epoch=4, labels=labelpath,
+                      settings=((None, None), (None, 2 ** 20), (2 ** 18, None), (2 ** 16, None), (2 ** 14, None))):
+    # estimate_memory of the fitted Doc2Vec against the cross-validated f1 / roc_auc of its embeddings,
+    # for (hash_buckets, max_vocab_size) pairs. The random forest of RQ2, without oversampling.
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import cross_validate
+
+    graphs, address_map, graphdigests = load_graphs(input_graph_file)
+    labelset = pd.read_csv(labels, index_col="address")["label"]
+    labelled = [(address, index) for address, index in address_map.items() if address in labelset.index]
+    target = labelset.loc[[address for address, index in labelled]].to_numpy()
+    rows = []
+    for hash_buckets, max_vocab_size in settings:
+        model = Cfg2Vec(dimensions=100, wl_iterations=epoch, hash_buckets=hash_buckets, max_vocab_size=max_vocab_size,
+                        path_budget=PATH_BUDGET, path_depth=PATH_DEPTH, path_time=PATH_TIME,
+                        feature_workers=FEATURE_WORKERS)
+        model.fit(graphs, graph_documents(model, graphs, graphdigests))
+        memory = model.estimate_memory()
+        data = model.get_embedding()[[index for address, index in labelled]]
+        estimator = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42, n_jobs=-1)
+        scores = cross_validate(estimator, data, target, cv=5, scoring=["f1", "roc_auc"])
+        rows.append({"hash_buckets": hash_buckets, "max_vocab_size": max_vocab_size,
+                     "vocabulary": len(model.model.wv), "memory_mb": memory["total"] / 1024 ** 2,
+                     "f1": scores["test_f1"].mean(), "roc_auc": scores["test_roc_auc"].mean()})
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
 if __name__ == "__main__":
     for epoch in range(1, 11):
         output_file = os.path.join(vecfeatuespath, f"filteredcfg_cfg2vec_{epoch}.csv")
@@ -1,13 +1,39 @@
 
 
 from parse.doc2vec import Doc2Vec, TaggedDocument
-from parse.features import WeisfeilerLehmanHashing
+from parse.features import WeisfeilerLehmanHashing, GraphDocuments, hash_documents
 from parse.estimator import Estimator
 
 import numpy as np
 import networkx as nx
+import hashlib
+import json
+import os
+import tempfile
+from multiprocessing import Pool
 from typing import List
 
+# version of the directory layout written by Cfg2Vec.save
+FORMAT = 1
+# version of the embeddings fit computes, bump it whenever a change to the WL, path or Doc2Vec code
+# changes them, so cached embeddings of the former code are not served
+VERSION = 1
+
+
+def _graph_document(task):
+    # module level so the feature pool can pickle it
+    graph, params = task
+    w = WeisfeilerLehmanHashing(graph, *params)
+    return w.get_graph_features(), w.truncated_paths
+
+
+def _graph_labels(task):
+    # every WL iteration with the base features and the path features, for GraphDocuments
+    graph, params = task
+    w = WeisfeilerLehmanHashing(graph, *params)
+    base = [features[0] for features in w.extracted_features.values()]
+    return base, w.iteration_labels, w.path_features, w.truncated_paths
+
 
 class Cfg2Vec(Estimator):
     def __init__(
@@ -23,7 +49,15 @@ class Cfg2Vec(Estimator):
             seed: int = 42,
             erase_base_features: bool = True,
             use_wl: bool = True,
-            use_path: bool = True
+            use_path: bool = True,
+            path_budget: int = None,
+            path_depth: int = None,
+            path_time: float = None,
+            feature_workers: int = 1,
+            corpus_file: bool = False,
+            corpus_dir: str = None,
+            hash_buckets: int = None,
+            max_vocab_size: int = None
     ):
         self.wl_iterations = wl_iterations
         self.attributed = attributed
@@ -37,28 +71,64 @@ class Cfg2Vec(Estimator):
         self.erase_base_features = erase_base_features
         self.use_wl = use_wl
         self.use_path = use_path
+        self.path_budget = path_budget
+        self.path_depth = path_depth
+        self.path_time = path_time
+        self.feature_workers = feature_workers
+        self.corpus_file = corpus_file
+        self.corpus_dir = corpus_dir
+        self.hash_buckets = hash_buckets
+        self.max_vocab_size = max_vocab_size
 
-    def fit(self, graphs: List[nx.classes.graph.Graph]):
-        self._set_seed()
-        graphs = self._check_graphs(graphs)
+    def _documents(self, graphs) -> List[List[str]]:
+        """WL and path documents of the graphs in their order, built by feature_workers processes."""
+        params = (self.wl_iterations, self.attributed, self.erase_base_features, self.use_wl, self.use_path,
+                  self.path_budget, self.path_depth, self.path_time)
+        results = self._pool_map(_graph_document, [(graph, params) for graph in graphs])
+        self._path_truncated = [truncated for words, truncated in results]
+        return [words for words, truncated in results]
 
-        documents = []
-        for i, graph in enumerate(graphs):
+    def _pool_map(self, task, tasks):
+        if self.feature_workers > 1 and len(tasks) > 1:
+            chunksize = max(1, len(tasks) // (self.feature_workers * 8))
+            with Pool(self.feature_workers) as pool:
+                return pool.map(task, tasks, chunksize)
+        return [task(t) for t in tasks]
 
-            w = WeisfeilerLehmanHashing(
-                graph,
-                self.wl_iterations,
-                self.attributed,
-                self.erase_base_features,
-                self.use_wl,
-                self.use_path
-            )
-            documents.append(w)
+    def extraction_params(self):
+        """Parameters the GraphDocuments of extract depend on."""
+        return {"attributed": self.attributed, "path_budget": self.path_budget,
+                "path_depth": self.path_depth, "path_time": self.path_time}
+
+    def extract(self, graphs, max_iterations: int) -> GraphDocuments:
+        """
+        WL labels of iterations 1..max_iterations and path features of the graphs, once, so fit
+        can take the documents of any wl_iterations <= max_iterations, use_wl and use_path from them.
+        """
+        graphs = self._check_graphs(graphs)
+        params = (max_iterations, self.attributed, False, True, True,
+                  self.path_budget, self.path_depth, self.path_time)
+        results = self._pool_map(_graph_labels, [(graph, params) for graph in graphs])
+        return GraphDocuments.fromresults(results, dict(max_iterations=max_iterations,
+                                                        params=self.extraction_params()))
+
+    def fit(self, graphs: List[nx.classes.graph.Graph], documents: GraphDocuments = None):
+        self._set_seed()
+        graphs = self._check_graphs(graphs)
 
+        if documents is None:
+            documents = self._documents(graphs)
+        else:
+            if documents.meta["params"] != self.extraction_params() or len(documents) != len(graphs):
+                raise ValueError("The documents were extracted from other graphs or parameters.")
+            self._path_truncated = documents.truncation()
+            documents = documents.documents(self.wl_iterations, self.erase_base_features,
+                                            self.use_wl, self.use_path)
+        documents = self._hashed(documents)
 
         tagged_documents = [
-            TaggedDocument(words=doc.get_graph_features(), tags=[str(i)])
-            for i, doc in enumerate(documents) if doc.get_graph_features()
+            TaggedDocument(words=doc, tags=[str(i)])
+            for i, doc in enumerate(documents) if doc
         ]
 
         if not tagged_documents:
@@ -69,11 +139,10 @@ class Cfg2Vec(Estimator):
             return
 
 
-        original_indices = [i for i, doc in enumerate(documents) if doc.get_graph_features()]
+        original_indices = [i for i, doc in enumerate(documents) if doc]
         index_map = {original_idx: new_idx for new_idx, original_idx in enumerate(original_indices)}
 
-        self.model = Doc2Vec(
-            tagged_documents,
+        params = dict(
             vector_size=self.dimensions,
             window=0,
             min_count=self.min_count,
@@ -83,43 +152,112 @@ class Cfg2Vec(Estimator):
             epochs=self.epochs,
             alpha=self.learning_rate,
             seed=self.seed,
+            max_vocab_size=self.max_vocab_size,
         )
 
-
         self._embedding = np.zeros((len(graphs), self.dimensions))
+        if self.corpus_file:
+            self.model = self._fit_corpus_file([doc.words for doc in tagged_documents], params)
+            # documents of a corpus file are tagged with their line number
+            for original_idx in original_indices:
+                self._embedding[original_idx] = self.model.dv[index_map[original_idx]]
+            return
+
+        self.model = Doc2Vec(tagged_documents, **params)
+
         for original_idx in original_indices:
             new_idx = index_map[original_idx]
             self._embedding[original_idx] = self.model.docvecs[str(original_idx)]
 
+    def _hashed(self, documents) -> List[List[str]]:
+        """Documents in the hash_buckets slots, or as they are without hash_buckets."""
+        if self.hash_buckets is None:
+            return documents
+        return hash_documents(documents, self.hash_buckets)
+
+    def estimate_memory(self) -> dict:
+        """Bytes of the Doc2Vec vocabulary, weights and doctags, as Doc2Vec.estimate_memory reports them."""
+        return self.model.estimate_memory()
+
+    def _fit_corpus_file(self, documents, params) -> Doc2Vec:
+        """
+        Train on the documents spilled to a temporary LineSentence file in corpus_dir, one line per
+        document. Every worker then reads and trains its own part of the file without the GIL,
+        instead of waiting for the single thread that feeds in-memory documents to the workers.
+        """
+        fd, path = tempfile.mkstemp(suffix=".txt", prefix="cfg2vec-", dir=self.corpus_dir)
+        try:
+            with os.fdopen(fd, "w") as fp:
+                for words in documents:
+                    fp.write(" ".join(words))
+                    fp.write("\n")
+            return Doc2Vec(corpus_file=path, **params)
+        finally:
+            os.remove(path)
+
     def get_embedding(self) -> np.array:
         return np.array(self._embedding)
 
+    def get_truncation(self) -> np.array:
+        """Paths left out of the path features of every graph of the last fit or infer."""
+        return np.array(self._path_truncated)
+
     def infer(self, graphs) -> np.array:
         self._set_seed()
         graphs = self._check_graphs(graphs)
 
 
-        documents = [
-            WeisfeilerLehmanHashing(
-                graph,
-                self.wl_iterations,
-                self.attributed,
-                self.erase_base_features,
-                self.use_wl,
-                self.use_path
+        documents = self._hashed(self._documents(graphs))
+
+        # one batch over the model threads, documents without features stay zero
+        embedding = np.zeros((len(documents), self.dimensions))
+        indexes = [i for i, doc in enumerate(documents) if doc]
+        if indexes:
+            embedding[indexes] = self.model.infer_vectors(
+                [documents[i] for i in indexes], alpha=self.learning_rate, min_alpha=0.00001,
+                epochs=self.epochs, workers=self.workers
             )
-            for graph in graphs
-        ]
 
-        documents = [doc.get_graph_features() for _, doc in enumerate(documents)]
+        return embedding
 
-        embedding = np.array(
-            [
-                self.model.infer_vector(
-                    doc, alpha=self.learning_rate, min_alpha=0.00001, epochs=self.epochs
-                ) if doc else np.zeros(self.dimensions)
-                for doc in documents
-            ]
-        )
+    def vocabulary_fingerprint(self) -> str:
+        """Digest of the Doc2Vec word vocabulary in index order, the tokens inferred documents are made of."""
+        text = "\n".join(str(key) for key in self.model.wv.index_to_key)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def save(self, path: str):
+        """
+        Save the fitted model to the directory path: cfg2vec.json with the parameters (WL configuration
+        included) and the vocabulary fingerprint, doc2vec.model with every weight array in a separate
+        .npy file so load can memory-map them, and the embedding of the fitted graphs.
+        """
+        if getattr(self, "model", None) is None:
+            raise ValueError("There is no fitted Doc2Vec model to save.")
+        os.makedirs(path, exist_ok=True)
+        self.model.save(os.path.join(path, "doc2vec.model"), sep_limit=0)
+        np.save(os.path.join(path, "embedding.npy"), self.get_embedding())
+        params = self.get_params()
+        params.pop("model")
+        meta = {"format": FORMAT,
+                "params": params,
+                "vocabulary": {"size": len(self.model.wv), "fingerprint": self.vocabulary_fingerprint()}}
+        # written last, a directory without it is an interrupted save
+        with open(os.path.join(path, "cfg2vec.json"), "w") as fp:
+            json.dump(meta, fp, indent=1, sort_keys=True)
 
-        return embedding
\ No newline at end of file
+    @staticmethod
+    def load(path: str, mmap: str = "r") -> "Cfg2Vec":
+        """
+        Load a model saved by save. With mmap="r" the weight arrays are read-only memory maps, so
+        processes that load the same directory share one copy of the pages; inference only reads them.
+        """
+        with open(os.path.join(path, "cfg2vec.json")) as fp:
+            meta = json.load(fp)
+        if meta["format"] != FORMAT:
+            raise ValueError("Model format {} is not supported, expected {}.".format(meta["format"], FORMAT))
+        estimator = Cfg2Vec(**meta["params"])
+        estimator.model = Doc2Vec.load(os.path.join(path, "doc2vec.model"), mmap=mmap)
+        if estimator.vocabulary_fingerprint() != meta["vocabulary"]["fingerprint"]:
+            raise ValueError("The vocabulary of {} does not match its fingerprint.".format(path))
+        estimator._embedding = np.load(os.path.join(path, "embedding.npy"), mmap_mode=mmap)
+        return estimator
@@ -61,8 +61,10 @@ Infer vector for a new document:
 
 import logging
 import os
+import zlib
 from collections import namedtuple, defaultdict
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from timeit import default_timer
 
 from dataclasses import dataclass
@@ -155,6 +157,17 @@ class Doctag:
         self.doc_count = new_val
 
 
+class _InferenceView:
+    """Read-only view of a model with its own random stream, so inference threads never share one."""
+
+    def __init__(self, model, random):
+        self.model = model
+        self.random = random
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
 class Doc2Vec(Word2Vec):
     def __init__(
             self, documents=None, corpus_file=None, vector_size=100, dm_mean=None, dm=1, dbow_words=0, dm_concat=0,
@@ -595,8 +608,9 @@ class Doc2Vec(Word2Vec):
 
         Notes
         -----
-        Subsequent calls to this function may infer different representations for the same document.
-        For a more stable representation, increase the number of epochs to assert a stricter convergence.
+        The random stream of the inference is seeded from the model seed and the document words, so the
+        same document gets the same representation on every call, alone or in :meth:`infer_vectors`.
+        The representation still depends on the number of epochs, more epochs assert a stricter convergence.
 
         Parameters
         ----------
@@ -621,40 +635,88 @@ class Doc2Vec(Word2Vec):
         if isinstance(doc_words, str):  # a common mistake; fail with a nicer error
             raise TypeError("Parameter doc_words of infer_vector() must be a list of strings (not a single string).")
 
+        return self.infer_vectors([doc_words], alpha=alpha, min_alpha=min_alpha, epochs=epochs, workers=1)[0]
+
+    def infer_vectors(self, documents, alpha=None, min_alpha=None, epochs=None, workers=None):
+        """Infer the vectors of many post-bulk training documents in one call.
+
+        Every worker thread allocates its `work`/`neu1` scratch buffers once and trains its share of the
+        documents into rows of the result; the training loops release the GIL. The random stream of a
+        document is seeded from the model seed and the document words, like its initial vector, so a
+        document gets the same vector from :meth:`infer_vector`, at any position of a batch and for any
+        number of workers.
+
+        Parameters
+        ----------
+        documents : list of list of str
+            The documents for which the vector representations will be inferred.
+        alpha, min_alpha, epochs : optional
+            As for :meth:`infer_vector`.
+        workers : int, optional
+            Number of threads, the model `workers` if unspecified.
+
+        Returns
+        -------
+        np.ndarray
+            The inferred vectors, one row per document.
+
+        """
+        for doc_words in documents:
+            if isinstance(doc_words, str):
+                raise TypeError("Documents of infer_vectors() must be lists of strings (not single strings).")
+
         alpha = alpha or self.alpha
         min_alpha = min_alpha or self.min_alpha
         epochs = epochs or self.epochs
+        workers = max(1, min(workers or self.workers, len(documents)))
 
-        doctag_vectors = pseudorandom_weak_vector(self.dv.vector_size, seed_string=' '.join(doc_words))
-        doctag_vectors = doctag_vectors.reshape(1, self.dv.vector_size)
-
+        vectors = zeros((len(documents), self.dv.vector_size), dtype=REAL)
+        if workers == 1:
+            self._infer_documents(documents, range(len(documents)), vectors, alpha, min_alpha, epochs)
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                stripes = [range(t, len(documents), workers) for t in range(workers)]
+                for _ in pool.map(lambda stripe: self._infer_documents(
+                        documents, stripe, vectors, alpha, min_alpha, epochs), stripes):
+                    pass
+        return vectors
+
+    def _infer_documents(self, documents, indexes, vectors, alpha, min_alpha, epochs):
+        """Infer documents[i] into vectors[i] for i in indexes, with one set of scratch buffers."""
         doctags_lockf = np.ones(1, dtype=REAL)
         doctag_indexes = [0]
         work = zeros(self.layer1_size, dtype=REAL)
-        if not self.sg:
-            neu1 = matutils.zeros_aligned(self.layer1_size, dtype=REAL)
-
+        neu1 = matutils.zeros_aligned(self.layer1_size, dtype=REAL)
         alpha_delta = (alpha - min_alpha) / max(epochs - 1, 1)
 
-        for i in range(epochs):
-            if self.sg:
-                train_document_dbow(
-                    self, doc_words, doctag_indexes, alpha, work,
-                    learn_words=False, learn_hidden=False, doctag_vectors=doctag_vectors, doctags_lockf=doctags_lockf
-                )
-            elif self.dm_concat:
-                train_document_dm_concat(
-                    self, doc_words, doctag_indexes, alpha, work, neu1,
-                    learn_words=False, learn_hidden=False, doctag_vectors=doctag_vectors, doctags_lockf=doctags_lockf
-                )
-            else:
-                train_document_dm(
-                    self, doc_words, doctag_indexes, alpha, work, neu1,
-                    learn_words=False, learn_hidden=False, doctag_vectors=doctag_vectors, doctags_lockf=doctags_lockf
-                )
-            alpha -= alpha_delta
-
-        return doctag_vectors[0]
+        for index in indexes:
+            doc_words = documents[index]
+            seed_string = ' '.join(doc_words)
+            doctag_vectors = vectors[index:index + 1]
+            doctag_vectors[0] = pseudorandom_weak_vector(self.dv.vector_size, seed_string=seed_string)
+            view = _InferenceView(self, np.random.RandomState(
+                [self.seed & 0xffffffff, zlib.crc32(seed_string.encode())]))
+            doc_alpha = alpha
+            for i in range(epochs):
+                if self.sg:
+                    train_document_dbow(
+                        view, doc_words, doctag_indexes, doc_alpha, work,
+                        learn_words=False, learn_hidden=False, doctag_vectors=doctag_vectors,
+                        doctags_lockf=doctags_lockf
+                    )
+                elif self.dm_concat:
+                    train_document_dm_concat(
+                        view, doc_words, doctag_indexes, doc_alpha, work, neu1,
+                        learn_words=False, learn_hidden=False, doctag_vectors=doctag_vectors,
+                        doctags_lockf=doctags_lockf
+                    )
+                else:
+                    train_document_dm(
+                        view, doc_words, doctag_indexes, doc_alpha, work, neu1,
+                        learn_words=False, learn_hidden=False, doctag_vectors=doctag_vectors,
+                        doctags_lockf=doctags_lockf
+                    )
+                doc_alpha -= alpha_delta
 
     def __getitem__(self, tag):
         """Get the vector representation of (possibly multi-term) tag.
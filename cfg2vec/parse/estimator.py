@@ -62,6 +62,9 @@ class Estimator(object):
 
     def _check_graph(self, graph: nx.classes.graph.Graph) -> nx.classes.graph.Graph:
         """Check the Karate Club assumptions about the graph."""
+        if not isinstance(graph, nx.Graph):
+            # CfgGraph: ids are dense by construction and the graph is not changed in place
+            return graph.withselfloops()
         self._check_indexing(graph)
         graph = self._ensure_integrity(graph)
 
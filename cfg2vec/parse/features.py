@@ -1,21 +1,67 @@
 
 
 import hashlib
+import json
+import os
+import time
+import numpy as np
 import networkx as nx
 from typing import List, Dict
 
 
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+# version of the arrays GraphDocuments saves, bump it whenever a change to the layout or to the
+# WL labels and path digests changes them, so documents of the former code are not loaded
+FORMAT = 1
+
+
+def _mix(x):
+    """
+    splitmix64 finalizer over an array of unsigned 64-bit integers.
+    """
+    x = x + _GOLDEN
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _stable_hash(text):
+    # 64-bit label of an attribute value, the same in every process
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def hash_documents(documents, buckets):
+    """
+    Feature hashing: every token becomes the number of one of buckets slots, so the vocabulary
+    stays at most buckets words whatever the corpus size. Colliding tokens share a word vector.
+    """
+    slots = {}
+    hashed = []
+    for words in documents:
+        doc = []
+        for word in words:
+            slot = slots.get(word)
+            if slot is None:
+                slot = slots[word] = str(_stable_hash(word) % buckets)
+            doc.append(slot)
+        hashed.append(doc)
+    return hashed
+
+
 class WeisfeilerLehmanHashing(object):
     """
     Weisfeiler-Lehman feature extractor class.
 
     Args:
-        graph (NetworkX graph): NetworkX graph for which we do WL hashing.
+        graph (NetworkX graph or CfgGraph): Graph for which we do WL hashing.
         wl_iterations (int): Number of WL iterations.
         attributed (bool): Presence of attributes.
         erase_base_feature (bool): Deleting the base features.
         use_wl (bool): Flag to include Weisfeiler-Lehman subgraph features.
         use_path (bool): Flag to include path sequence features.
+        path_budget (int): Maximal number of path features, None for all.
+        path_depth (int): Maximal number of nodes on a path, longer paths are cut. None for no cap.
+        path_time (float): Seconds the path search may take, None for no limit.
     """
 
     def __init__(
@@ -25,7 +71,10 @@ class WeisfeilerLehmanHashing(object):
             attributed: bool,
             erase_base_features: bool,
             use_wl: bool,
-            use_path: bool
+            use_path: bool,
+            path_budget: int = None,
+            path_depth: int = None,
+            path_time: float = None
     ):
         """
         Initialization method which also executes feature extraction.
@@ -37,23 +86,53 @@ class WeisfeilerLehmanHashing(object):
         self.use_wl = use_wl
         self.use_path = use_path
         self.use_degree = True
+        self.path_budget = path_budget
+        self.path_depth = path_depth
+        self.path_time = path_time
 
         
         self._set_features()
         self._do_recursions()
         self._extract_path_features()
 
+    def _adjacency(self):
+        """
+        Node list and the neighbours (successors) of every node as CSR index arrays.
+        """
+        nodes = list(self.graph.nodes())
+        if hasattr(self.graph, "succptr"):
+            # CfgGraph, nodes are the ids already
+            return nodes, self.graph.succptr, self.graph.succ.astype(np.int64)
+        index = {node: i for i, node in enumerate(nodes)}
+        counts = [0]
+        neighbors = []
+        for node in nodes:
+            nebs = [index[neb] for neb in self.graph.neighbors(node)]
+            neighbors.extend(nebs)
+            counts.append(len(nebs))
+        return nodes, np.cumsum(counts), np.array(neighbors, dtype=np.int64)
+
     def _set_features(self):
         """
         Creating the base features.
         """
+        self._nodes, self._ptr, self._neighbors = self._adjacency()
         if self.attributed:
-            self.features = nx.get_node_attributes(self.graph, "feature")
+            if isinstance(self.graph, nx.Graph):
+                self.features = nx.get_node_attributes(self.graph, "feature")
+            else:
+                self.features = self.graph.attribute("feature")
+            values = [self.features[node] for node in self._nodes]
+            self.labels = np.array([_stable_hash(str(v)) for v in values], dtype=np.uint64)
         else:
-            self.features = {
-                node: self.graph.degree(node) for node in self.graph.nodes()
-            }
-        self.extracted_features = {k: [str(v)] for k, v in self.features.items()}
+            if hasattr(self.graph, "degrees"):
+                degrees = self.graph.degrees()
+            else:
+                degrees = np.array([self.graph.degree(node) for node in self._nodes], dtype=np.int64)
+            self.features = dict(zip(self._nodes, degrees.tolist()))
+            values = degrees.tolist()
+            self.labels = degrees.astype(np.uint64)
+        self.extracted_features = {node: [str(v)] for node, v in zip(self._nodes, values)}
 
     def _erase_base_features(self):
         """
@@ -62,30 +141,39 @@ class WeisfeilerLehmanHashing(object):
         for k, v in self.extracted_features.items():
             del self.extracted_features[k][0]
 
-    def _do_a_recursion(self):
+    def _do_a_recursion(self, iteration):
         """
-        The method does a single WL recursion.
+        The method does a single WL recursion on all nodes at once. The new label of a node
+        combines its label with the multiset of its neighbour labels: every neighbour label is
+        mixed and the mixes are summed per node, which is the same for any order of the sorted
+        neighbour label array. Labels stay unsigned 64-bit integers.
         """
-        new_features = {}
-        for node in self.graph.nodes():
-            nebs = self.graph.neighbors(node)
-            degs = [self.features[neb] for neb in nebs]
-            features = [str(self.features[node])] + sorted([str(deg) for deg in degs])
-            features = "_".join(features)
-            hash_object = hashlib.md5(features.encode())
-            hashing = hash_object.hexdigest()
-            new_features[node] = hashing
-        self.extracted_features = {
-            k: self.extracted_features[k] + [v] for k, v in new_features.items()
-        }
-        return new_features
+        labels = self.labels
+        mixed = _mix(labels[self._neighbors])
+        cumulative = np.zeros(len(mixed) + 1, dtype=np.uint64)
+        np.cumsum(mixed, dtype=np.uint64, out=cumulative[1:])
+        sums = cumulative[self._ptr[1:]] - cumulative[self._ptr[:-1]]
+        # the own label goes through a second, salted mix so it never cancels against a neighbour
+        own = _mix(_mix(labels) ^ np.uint64(iteration))
+        return _mix(own + sums)
 
     def _do_recursions(self):
         """
-        The method does a series of WL recursions.
+        The method does a series of WL recursions. Labels only become string tokens here,
+        for the documents handed to Doc2Vec.
         """
-        for _ in range(self.wl_iterations):
-            self.features = self._do_a_recursion()
+        iterations = []
+        for iteration in range(1, self.wl_iterations + 1):
+            self.labels = self._do_a_recursion(iteration)
+            iterations.append(self.labels)
+        if iterations:
+            self.iteration_labels = np.stack(iterations, axis=1)
+            tokens = self.iteration_labels.tolist()
+            for node, labels in zip(self._nodes, tokens):
+                self.extracted_features[node].extend(format(label, "016x") for label in labels)
+        else:
+            self.iteration_labels = np.zeros((len(self._nodes), 0), dtype=np.uint64)
+        self.features = dict(zip(self._nodes, self.labels.tolist()))
 
         if self.erase_base_features:
             self._erase_base_features()
@@ -123,62 +211,242 @@ class WeisfeilerLehmanHashing(object):
 
         return final_features
 
-    def _dfs(self, node, visited, paths):
+    def _reaching(self, sinks):
         """
-        Corrected Depth-First Search to handle cycles.
-        'visited' now tracks the nodes in the current path.
+        Nodes with a path to a sink. Paths are only recorded at sinks, so the search never
+        needs to enter the other nodes.
         """
-        visited.append(node)
+        reaching = set(sinks)
+        queue = list(sinks)
+        while queue:
+            node = queue.pop()
+            for pre in self.graph.predecessors(node):
+                if pre not in reaching:
+                    reaching.add(pre)
+                    queue.append(pre)
+        return reaching
 
-        
-        if self.graph.out_degree(node) == 0:
-            paths.append(visited.copy())
-        else:
-            for i in self.graph.successors(node):
-                
-                
-                if i in visited:
-                    continue
-                self._dfs(i, visited, paths)
+    def _count_paths(self, reaching, starts):
+        """
+        Number of root-to-sink paths by DP when the searched subgraph is a DAG, None otherwise.
+        On a DAG every path is simple, so this is the number of paths the search can find.
+        """
+        indegree = {node: 0 for node in reaching}
+        for node in reaching:
+            for suc in self.graph.successors(node):
+                if suc in reaching:
+                    indegree[suc] += 1
+        order = [node for node in reaching if indegree[node] == 0]
+        for node in order:
+            for suc in self.graph.successors(node):
+                if suc in reaching:
+                    indegree[suc] -= 1
+                    if indegree[suc] == 0:
+                        order.append(suc)
+        if len(order) < len(reaching):
+            return None
+        counts = {}
+        for node in reversed(order):
+            if self.graph.out_degree(node) == 0:
+                counts[node] = 1
+            else:
+                counts[node] = sum(counts[suc] for suc in self.graph.successors(node) if suc in reaching)
+        return sum(counts.get(node, 0) for node in starts)
 
-        
-        
-        visited.pop()
+    def _walk(self, start, reaching, tokens, features, deadline):
+        """
+        Depth-first search over the simple paths from start, recording the md5 of the "_" joined
+        path tokens at every sink, in the order of the former recursive _dfs. The digest of each
+        prefix is kept on the stack, so a path costs one update per node. Returns the number of
+        branches cut by the budget, depth cap or time limit.
+        """
+        if start not in reaching:
+            return 0
+        if self.path_budget is not None and len(features) >= self.path_budget:
+            return 1
+        cut = 0
+        steps = 0
+        onpath = {start}
+        digest = hashlib.md5(tokens[start].encode())
+        stack = [(start, digest, iter(self.graph.successors(start)))]
+        if self.graph.out_degree(start) == 0:
+            features.append(digest.hexdigest())
+        while stack:
+            node, digest, successors = stack[-1]
+            suc = next(successors, None)
+            if suc is None:
+                stack.pop()
+                onpath.discard(node)
+                continue
+            if suc in onpath or suc not in reaching:
+                continue
+            steps += 1
+            if self.path_budget is not None and len(features) >= self.path_budget or \
+                    self.path_depth is not None and len(stack) >= self.path_depth or \
+                    deadline is not None and steps % 1024 == 0 and time.perf_counter() > deadline:
+                cut += 1
+                if self.path_depth is None or len(stack) < self.path_depth:
+                    # budget or time is spent, the rest of the search is cut as a whole
+                    return cut
+                continue
+            extended = digest.copy()
+            extended.update(("_" + tokens[suc]).encode())
+            if self.graph.out_degree(suc) == 0:
+                features.append(extended.hexdigest())
+                continue
+            onpath.add(suc)
+            stack.append((suc, extended, iter(self.graph.successors(suc))))
+        return cut
 
     def _extract_path_features(self):
+        """
+        Path features: one token per simple path from a root (no predecessors) to a sink
+        (no successors), made of the degrees along the path. Without roots the search starts
+        at the first node. path_budget, path_depth and path_time bound the search; the paths
+        left out are counted in truncated_paths, exactly when the searched subgraph is a DAG
+        (truncation_exact), otherwise as the number of cut branches.
+        """
+        self.path_features = []
+        self.truncated_paths = 0
+        self.truncation_exact = True
         if len(self.graph) == 0:
-            self.path_features = []
             return
 
-        paths = []
-        
-        for start_node in self.graph.nodes:
-            if self.graph.in_degree(start_node) == 0:
-                self._dfs(start_node, [], paths)
-
-        
-        
-        if not paths and len(self.graph.nodes) > 0:
-            node = list(self.graph.nodes)[0]
-            self._dfs(node, [], paths)
-
+        nodes = list(self.graph.nodes())
+        sinks = [node for node in nodes if self.graph.out_degree(node) == 0]
+        if not sinks:
+            # e.g. the self loops of Estimator._ensure_integrity, no path can end anywhere
+            return
+        reaching = self._reaching(sinks)
+        starts = [node for node in nodes if self.graph.in_degree(node) == 0]
         if self.use_degree:
-            paths = self._change_to_degree(paths)
+            tokens = {node: str(self.graph.degree(node)) for node in reaching}
+        else:
+            tokens = {node: str(node) for node in reaching}
+        deadline = None if self.path_time is None else time.perf_counter() + self.path_time
 
         features = []
-        for i in paths:
-            p = [str(num) for num in i]
-            f = "_".join(p)
-            hash_object = hashlib.md5(f.encode())
-            hashing = hash_object.hexdigest()
-            features.append(hashing)
+        cut = 0
+        for start in starts:
+            cut += self._walk(start, reaching, tokens, features, deadline)
+        if not features and not cut:
+            starts = [nodes[0]]
+            cut += self._walk(nodes[0], reaching, tokens, features, deadline)
         self.path_features = features
 
-    def _change_to_degree(self, paths):
-        res = []
-        for path in paths:
-            newpath = []
-            for node in path:
-                newpath.append(self.graph.degree(node))
-            res.append(newpath)
-        return res
\ No newline at end of file
+        if cut:
+            total = self._count_paths(reaching, starts)
+            if total is None:
+                self.truncation_exact = False
+                self.truncated_paths = cut
+            else:
+                self.truncated_paths = total - len(features)
+
+
+class GraphDocuments(object):
+    """
+    WL labels up to max_iterations and path features of a list of graphs, extracted once and
+    sliced into the documents of any wl_iterations <= max_iterations, use_wl and use_path.
+
+    Labels of WL iteration k do not depend on the later iterations and the path features do not
+    depend on the WL iterations, so the slices are the documents WeisfeilerLehmanHashing builds
+    for each setting. Saved as one .npy file per array, memory-mapped on load:
+        nodeptr, base       CSR offsets of the nodes of every graph, base feature of every node
+        labels              WL labels of every node, one column per iteration
+        pathptr, paths      CSR offsets of the path features of every graph, md5 digests as
+                            16 byte rows (a bytes dtype would drop trailing zero bytes)
+    meta.json holds the format, max_iterations, the extraction parameters and the truncated path counts.
+    """
+
+    ARRAYS = ["nodeptr", "base", "labels", "pathptr", "paths"]
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+
+    @staticmethod
+    def fromresults(results, meta):
+        """
+        Collect (base features, iteration_labels, path_features, truncated_paths) of every graph,
+        from WeisfeilerLehmanHashing run with erase_base_features=False.
+        """
+        nodes = [0]
+        paths = [0]
+        base, labels, digests, truncated = [], [], [], []
+        for features, iteration_labels, path_features, truncated_paths in results:
+            nodes.append(nodes[-1] + len(iteration_labels))
+            base.extend(features)
+            labels.append(iteration_labels)
+            paths.append(paths[-1] + len(path_features))
+            digests.append("".join(path_features))
+            truncated.append(truncated_paths)
+        iterations = meta["max_iterations"]
+        arrays = {"nodeptr": np.array(nodes, dtype=np.int64),
+                  "base": np.array(base, dtype=str) if base else np.zeros(0, dtype="<U1"),
+                  "labels": np.concatenate(labels) if labels else np.zeros((0, iterations), dtype=np.uint64),
+                  "pathptr": np.array(paths, dtype=np.int64),
+                  "paths": np.frombuffer(bytes.fromhex("".join(digests)), dtype=np.uint8).reshape(-1, 16)}
+        return GraphDocuments(arrays, dict(meta, format=FORMAT, truncated=truncated))
+
+    def __len__(self):
+        return len(self.arrays["nodeptr"]) - 1
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in GraphDocuments.ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), self.arrays[name])
+        with open(os.path.join(path, "meta.json"), "w") as fp:
+            json.dump(self.meta, fp)
+
+    @staticmethod
+    def load(path):
+        with open(os.path.join(path, "meta.json")) as fp:
+            meta = json.load(fp)
+        if meta.get("format") != FORMAT:
+            raise ValueError("Documents format {} is not supported, expected {}.".format(meta.get("format"), FORMAT))
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                  for name in GraphDocuments.ARRAYS}
+        return GraphDocuments(arrays, meta)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def truncation(self) -> List[int]:
+        return self.meta["truncated"]
+
+    def documents(self, wl_iterations: int, erase_base_features: bool, use_wl: bool,
+                  use_path: bool) -> List[List[str]]:
+        """
+        The get_graph_features() of every graph for these settings.
+        """
+        if wl_iterations > self.meta["max_iterations"]:
+            raise ValueError("{} WL iterations asked, {} extracted".format(
+                wl_iterations, self.meta["max_iterations"]))
+        nodeptr = self.arrays["nodeptr"].tolist()
+        pathptr = self.arrays["pathptr"].tolist()
+        base = self.arrays["base"]
+        labels = self.arrays["labels"]
+        paths = self.arrays["paths"]
+        documents = []
+        for g in range(len(self)):
+            n0, n1 = nodeptr[g], nodeptr[g + 1]
+            wl_features = []
+            rows = np.asarray(labels[n0:n1, :wl_iterations]).tolist()
+            if erase_base_features:
+                for row in rows:
+                    wl_features.extend(format(label, "016x") for label in row)
+            else:
+                for feature, row in zip(base[n0:n1].tolist(), rows):
+                    wl_features.append(feature)
+                    wl_features.extend(format(label, "016x") for label in row)
+            final_features = []
+            if use_wl:
+                final_features.extend(wl_features)
+            if use_path:
+                digests = np.ascontiguousarray(paths[pathptr[g]:pathptr[g + 1]]).tobytes().hex()
+                final_features.extend(digests[i:i + 32] for i in range(0, len(digests), 32))
+            if not final_features:
+                final_features.extend(wl_features)
+            documents.append(final_features)
+        return documents
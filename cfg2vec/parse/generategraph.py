@@ -1,11 +1,21 @@
 import networkx as nx
 import pandas as pd
-import os,json,math,csv
+import numpy as np
+import os,json,math,csv,contextlib,io
+
+# the cfgbuilder package is shared with the repository root on the path, run from cfg2vec/parse/ as
+#   PYTHONPATH=../.. python generategraph.py
+from cfgbuilder.parse.stream import iterrecords, countrecords
+from cfgbuilder.parse.CfgCache import CfgCache, payloaddigest, versioned
+from cfgbuilder.parse.CfgGraph import CfgGraph
 
 THRESHOLD = 50
+# version of the graphs getGraph builds, bump it when a change to getGraph or CfgGraph changes them
+GRAPH_VERSION = 1
 
 blockpath = "../../dataset/blocks/filteredcfgs.csv"
 listspath = "../../dataset/graphlists/"
+cachepath = "../../dataset/cache/cfgcache.sqlite"
 
 
 def generatesimpleGraph(basicblocks):
@@ -102,7 +112,15 @@ def merge_nodes(G):
 
 
 def getGraph(basicblocks):
-    
+    # CfgGraph ids are dense already, so no relabelGraph; the networkx functions above are the reference
+    g = CfgGraph.fromblocks(basicblocks)
+    g = g.removenodes(np.flatnonzero(~g.attrs["retain"]).tolist())
+    if len(g) > THRESHOLD:
+        g = g.mergechains()
+    return g
+
+
+def getnxGraph(basicblocks):
     g = generatefilteredGraph(basicblocks)
     if len(g) > THRESHOLD:
         g = merge_nodes(g)
@@ -110,53 +128,114 @@ def getGraph(basicblocks):
     return r
 
 
-def extract_cfglist(file):
-    data = pd.read_csv(blockpath, index_col="address")
-    print("load data finished")
+def compareremoval(file=blockpath):
+    # CfgGraph.removenodes against removenode one block at a time on every cfg of the corpus
+    same = 0
+    mismatch = []
+    for ind, blockjson in iterrecords(file, "basicblocks"):
+        basicblocks = json.loads(blockjson)["basicblocks"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = relabelGraph(generatefilteredGraph(basicblocks))
+        c = CfgGraph.fromblocks(basicblocks)
+        c = c.removenodes(np.flatnonzero(~c.attrs["retain"]).tolist())
+        if (list(c.nodes()), c.edges()) == (list(r.nodes), list(r.edges)):
+            same += 1
+        else:
+            mismatch.append(ind)
+    print(f"removenode equal: {same}, mismatches: {len(mismatch)}")
+    print("Mismatches:", mismatch)
+    return mismatch
+
+
+def comparemerge(file=blockpath):
+    # CfgGraph.mergechains against merge_nodes on every non-empty filtered graph of the corpus
+    same = 0
+    mismatch = []
+    reffail = []
+    for ind, blockjson in iterrecords(file, "basicblocks"):
+        basicblocks = json.loads(blockjson)["basicblocks"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            g = generatefilteredGraph(basicblocks)
+        if len(g) == 0:
+            continue
+        try:
+            r = relabelGraph(merge_nodes(g))
+            expected = (list(r.nodes), list(r.edges))
+        except RecursionError:
+            # the iterative merge has no depth limit, there is nothing to compare with
+            reffail.append(ind)
+            continue
+        except ValueError:
+            # a chain back to the start node, both refuse it
+            expected = "ValueError"
+        c = CfgGraph.fromblocks(basicblocks)
+        c = c.removenodes(np.flatnonzero(~c.attrs["retain"]).tolist())
+        try:
+            c = c.mergechains()
+            result = (list(c.nodes()), c.edges())
+        except ValueError:
+            result = "ValueError"
+        if result == expected:
+            same += 1
+        else:
+            mismatch.append(ind)
+    print(f"merge_nodes equal: {same}, mismatches: {len(mismatch)}, reference failed: {len(reffail)}")
+    print("Mismatches:", mismatch)
+    print("Recursion limit in merge_nodes:", reffail)
+    return mismatch
+
 
+def extract_cfglist(file, cache=cachepath):
     success = 0
-    total = len(data.index)
+    total = countrecords(blockpath)
     fail = 0
     faillist = []
     sh = []
+    kind = versioned("graph:{}:{}".format(os.path.basename(blockpath), THRESHOLD), GRAPH_VERSION)
 
-    
-    rows_list = []
-
-    for ind in data.index:
-        try:
-            blockjson = json.loads(data.loc[ind, "basicblocks"])
-            g = getGraph(blockjson["basicblocks"])
-            if len(g) == 0:
-                sh.append(ind)
-
-            
-            newline = {
-                "address": ind,
-                "nodes": json.dumps(list(g.nodes)),
-                "edges": json.dumps(list(g.edges))
-            }
-
-            
-            rows_list.append(newline)
-
-            success += 1
-
-        except Exception as e:
-            print(f"Error processing {ind}: {e}")
-            faillist.append(ind)
-            fail += 1
-        finally:
-
-            if success % 100 == 0:
-                print(f"{success} / {total} (Failed: {fail})")
-
-    df = pd.DataFrame(rows_list)
-
-    
     os.makedirs(os.path.dirname(listspath + file), exist_ok=True)
 
-    df.to_csv(listspath + file, index=False)
+    # rows are written as they are built instead of collected into a DataFrame
+    with open(listspath + file, "w", newline="") as fp, CfgCache(cache or ":memory:") as cache:
+        writer = csv.DictWriter(fp, fieldnames=["address", "nodes", "edges"])
+        writer.writeheader()
+        for ind, blockjson in iterrecords(blockpath, "basicblocks"):
+            if blockjson is None:
+                # marker row of a cfg variant that failed, already in faillist.csv
+                total -= 1
+                continue
+            try:
+                key = payloaddigest(blockjson, ind)
+                graph = cache.get(kind, key)
+                if graph is None:
+                    g = getGraph(json.loads(blockjson)["basicblocks"])
+                    graph = json.dumps([json.dumps(list(g.nodes())), json.dumps(g.edges())])
+                    cache.put(kind, key, graph, ind)
+                nodes, edges = json.loads(graph)
+                if nodes == "[]":
+                    sh.append(ind)
+
+                newline = {
+                    "address": ind,
+                    "nodes": nodes,
+                    "edges": edges
+                }
+
+                writer.writerow(newline)
+
+                success += 1
+
+            except Exception as e:
+                print(f"Error processing {ind}: {e}")
+                faillist.append(ind)
+                fail += 1
+            finally:
+
+                if success % 100 == 0:
+                    cache.commit()
+                    print(f"{success} / {total} (Failed: {fail})")
+        cache.report()
+
     print("Failed list:", faillist)
     print("Empty graphs:", sh)
     print(f"Saved to {listspath + file}")
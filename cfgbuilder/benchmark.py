@@ -0,0 +1,182 @@
+from parse.CfgBuilder import CfgBuilder
+from parse import decoder
+from parse.BasicBlock import BasicBlock
+from parse.entity import OrderDict, Pair, StringCleaner, BytecodeCleaner
+import time, tracemalloc
+
+# Micro-benchmarks for the CFG construction pipeline on synthetic contracts.
+# Run from the cfgbuilder directory: python benchmark.py
+
+SIZES = [1000, 2000, 5000, 10000]
+
+
+class LinearOrderDict(OrderDict):
+    """The former list-backed OrderDict, kept here as a scaling reference."""
+
+    __slots__ = ['orderlist']
+
+    def __init__(self):
+        super().__init__()
+        self.orderlist = []
+
+    def update(self, key, value):
+        for tp in self.orderlist:
+            if tp.key == key:
+                tp.setValue(value)
+                return
+        self.orderlist.append(Pair(key, value))
+        super().update(key, value)
+
+    def get(self, key):
+        for tp in self.orderlist:
+            if tp.key == key:
+                return tp.value
+
+    def keys(self):
+        for tp in self.orderlist:
+            yield tp.key
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+
+class LinearBasicBlock(BasicBlock):
+    """BasicBlock with the former list adjacency, kept here as a scaling reference."""
+
+    __slots__ = []
+
+    def __init__(self, offset):
+        super().__init__(offset)
+        self._predecessors = []
+        self._successors = []
+
+    def add_successor(self, next):
+        if next.offset == self.offset or next.offset == 0:
+            return
+        if next not in self._successors:
+            self._successors.append(next)
+        if self not in next._predecessors:
+            next._predecessors.append(self)
+
+
+def synthetic_bytecode(blocks):
+    # every block is JUMPDEST PUSH3 <next> JUMPI, so each block has a fall-through and a jump edge
+    code = "5b"
+    for i in range(blocks - 1):
+        target = (i + 1) * 6
+        code += "62{:06x}575b".format(target)
+    code += "00"
+    return code
+
+
+def bench_blockmap(sizes=SIZES):
+    builder = CfgBuilder()
+    builder.name = "synthetic"
+    print("{:>8} {:>12} {:>12}".format("blocks", "linear(s)", "hashed(s)"))
+    for size in sizes:
+        opcode = list(builder.disassemble(synthetic_bytecode(size)))
+        times = []
+        for cls in (LinearOrderDict, OrderDict):
+            start = time.time()
+            blocks = cls()
+            for pair in builder.generateBasicBlocks(opcode):
+                blocks.update(pair.key, pair.value)
+            builder.calculateSuccessors(blocks)
+            times.append(time.time() - start)
+        print("{:>8} {:>12.3f} {:>12.3f}".format(size, times[0], times[1]))
+
+
+def exits_bytecode(exits):
+    # every block is JUMPDEST STOP, so every block is a function exit linked to the super stop
+    return "5b00" * exits
+
+
+def superstop(blocks, blocktype):
+    # CfgBuilder.addSuperStop with the stop block of the given class
+    stop = blocktype(-1)
+    for offset, block in blocks:
+        if not block.hasSuccessor():
+            block.add_successor(stop)
+    blocks.update(-1, stop)
+
+
+def bench_superstop(sizes=SIZES, repeat=3):
+    # linking every exit to the super stop with list adjacency against the dict based one
+    print("{:>8} {:>12} {:>12} {:>8}".format("exits", "list(s)", "dict(s)", "speedup"))
+    for size in sizes:
+        code = exits_bytecode(size)
+        times = []
+        for blocktype in (LinearBasicBlock, BasicBlock):
+            elapsed = 0
+            for i in range(repeat):
+                blocks = OrderDict()
+                for offset, opcodes, pcs, operands in decoder.blocks(code):
+                    block = blocktype(offset)
+                    block.setops(opcodes, pcs, operands)
+                    blocks.update(offset, block)
+                start = time.time()
+                superstop(blocks, blocktype)
+                elapsed += time.time() - start
+            times.append(elapsed / repeat)
+        print("{:>8} {:>12.4f} {:>12.4f} {:>7.1f}x".format(size, times[0], times[1], times[0] / times[1]))
+
+
+def bench_decode(sizes=SIZES, repeat=5):
+    # pyevmasm instructions + generateBasicBlocks against the table driven decoder
+    builder = CfgBuilder()
+    builder.name = "synthetic"
+    print("{:>8} {:>12} {:>12} {:>8}".format("blocks", "pyevmasm(s)", "decoder(s)", "speedup"))
+    for size in sizes:
+        code = synthetic_bytecode(size)
+        times = []
+        for build in (lambda: builder.generateBasicBlocks(builder.disassemble(code)),
+                      lambda: builder.decodeBasicBlocks(code)):
+            start = time.time()
+            for i in range(repeat):
+                build()
+            times.append((time.time() - start) / repeat)
+        print("{:>8} {:>12.4f} {:>12.4f} {:>7.1f}x".format(size, times[0], times[1], times[0] / times[1]))
+
+
+def bench_clean(sizes=SIZES, repeat=20):
+    # cleaning a creation code with metadata trailer down to the runtime bytes the decoder reads:
+    # regex cleaner on the hex string + fromhex, against the bytes cleaner
+    print("{:>8} {:>12} {:>12} {:>8}".format("blocks", "string(s)", "bytes(s)", "speedup"))
+    for size in sizes:
+        runtime = "6080604052" + synthetic_bytecode(size)
+        code = ("6080604052348015600f57600080fd5b50610000806100006000396000f300" + runtime +
+                "a165627a7a72305820" + "00" * 32 + "0029")
+        times = []
+        for clean in (lambda: decoder.tobytes(StringCleaner.removeInfo(code)),
+                      lambda: decoder.tobytes(BytecodeCleaner.removeInfo(code))):
+            start = time.time()
+            for i in range(repeat):
+                clean()
+            times.append((time.time() - start) / repeat)
+        print("{:>8} {:>12.5f} {:>12.5f} {:>7.1f}x".format(size, times[0], times[1], times[0] / times[1]))
+
+
+def bench_memory(sizes=SIZES):
+    # traced bytes held by the built basic blocks, against the pyevmasm instructions they replace
+    builder = CfgBuilder()
+    builder.name = "synthetic"
+    print("{:>8} {:>16} {:>16}".format("blocks", "instructions(B)", "blocks(B)"))
+    for size in sizes:
+        code = synthetic_bytecode(size)
+        tracemalloc.start()
+        opcode = list(builder.disassemble(code))
+        instructions = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        blocks = builder.generateBasicBlocks(opcode)
+        compact = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("{:>8} {:>16} {:>16}".format(size, instructions, compact))
+
+
+if __name__ == "__main__":
+    bench_blockmap()
+    bench_decode()
+    bench_clean()
+    bench_superstop()
+    bench_memory()
@@ -3,6 +3,8 @@ from parse.CfgBuilder import CfgBuilder
 from parse.CfgAnalysis import CfgAnalysis
 from parse.CfgIdentify import CfgIdentify
 from parse.entity import StringCleaner, Logger, Stack
+from parse.stream import iterrecords, findrecord, countrecords
+from parse.CfgCache import CfgCache, payloaddigest, versioned
 from pyevmasm import disassemble_all
 import pandas as pd
 import os,time,json,re,csv
@@ -12,6 +14,9 @@ dirpath = os.path.dirname(__file__)
 
 cfgpath = "../dataset/blocks/"
 listpath = "../dataset/lists/"
+cachepath = "../dataset/cache/cfgcache.sqlite"
+# version of the op lists extract computes, bump it when a change to extract changes them
+OPLIST_VERSION = 1
 
 
 
@@ -33,22 +38,30 @@ def extract(blockjson):
                 contract_list.append(blocklist)
     return contract_list
 
-def extract_oplist(input,output):
+def extract_oplist(input,output,cache=cachepath):
     start = time.time()
-    dataset = pd.read_csv(cfgpath + input,index_col="address")
-    count = [0,0,6166]
+    count = [0,0,countrecords(cfgpath + input)]
     faillist = []
+    kind = versioned("oplist:" + input, OPLIST_VERSION)
 
-    with open(listpath + output,"w")as fp:
+    with open(listpath + output,"w")as fp, CfgCache(cache or ":memory:") as cache:
         fieldnames = ['address','oplist']
         writer = csv.DictWriter(fp, fieldnames=fieldnames)
         writer.writeheader()
-        for i in dataset.index:
+        for i, blockjson in iterrecords(cfgpath + input, "basicblocks"):
+            if blockjson is None:
+                # marker row of a cfg variant that failed, already in faillist.csv
+                count[2] -= 1
+                continue
             try:
-                blockjson = dataset.loc[i,"basicblocks"]
-                list = extract(blockjson)
+                # op lists do not depend on the address, clones share one entry
+                key = payloaddigest(blockjson, i)
+                oplist = cache.get(kind, key)
+                if oplist is None:
+                    oplist = json.dumps(extract(blockjson))
+                    cache.put(kind, key, oplist, i)
                 x = {"address":i,
-                        "oplist":json.dumps(list)}
+                        "oplist":oplist}
                 writer.writerow(x)
             except Exception as e:
                 print(e)
@@ -57,16 +70,18 @@ def extract_oplist(input,output):
             else:
                 count[0] += 1
             finally:
+                if sum(count[:2]) % 256 == 0:
+                    cache.commit()
                 print(count)
+        cache.report()
     end = time.time()
     use = end-start
     print(use)
 
 def extact_test():
-    dataset = pd.read_csv(cfgpath + "identifiedcfgs.csv",index_col="address")
     builder = CfgBuilder()
     i = "0x1a19c2aec934eb39c92cff0f1ba46efe8f6c56fe"
-    blockjson = dataset.loc[i,"basicblocks"]
+    blockjson = findrecord(cfgpath + "identifiedcfgs.csv", i, "basicblocks")
     cfg = builder.rebuildCfg(blockjson)
     cfg.storetxt()
     analysis = CfgAnalysis(cfg)
@@ -2,10 +2,15 @@ from parse.Contract import Contract
 from parse.CfgBuilder import CfgBuilder
 from parse.CfgAnalysis import CfgAnalysis
 from parse.CfgIdentify import CfgIdentify
-from parse.entity import StringCleaner, Logger, Stack
+from parse.CfgStore import CfgStoreWriter
+from parse.stream import iterrecords, iterchunks, countrecords
+from parse.CfgCache import CfgCache, digest, payloaddigest, renamecfg, versioned
+from parse.entity import BytecodeCleaner, Logger, Stack
 from pyevmasm import disassemble_all
+from contextlib import contextmanager, ExitStack
+from multiprocessing import Pool
 import pandas as pd
-import os, time, json
+import os, time, json, datetime, signal
 import csv
 import numpy as np
 import gensim
@@ -14,231 +19,387 @@ dirpath = os.path.dirname(__file__)
 
 datapath = "../dataset/dataset_6166.csv"
 blockpath = "../dataset/blocks/"
+failpath = dirpath + "/faillist.csv"
+cachepath = "../dataset/cache/cfgcache.sqlite"
 
 TOTAL_NUM = 6166
 
-
-def generaterawcfg():
-    start = time.time()
-    dataset = pd.read_csv(datapath, index_col="address")
-    count = [0, 0, TOTAL_NUM]
-    faillist = []
-
-    
-    with open(blockpath + "rawcfgs.csv", "w") as fp:
-        fieldnames = ['address', 'basicblocks']
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        builder = CfgBuilder()
-        for i in dataset.index:
-            bytecode = dataset.loc[i, "bytecode"]
-            bytecode = StringCleaner.removeInfo(bytecode)
-            try:
-                cfg = builder.buildCfg(i, bytecode)
-                blockjson = cfg.storejson()
-
-                x = {"address": i,
-                     "basicblocks": json.dumps(blockjson)}
-
-                writer.writerow(x)
-
-            except Exception as e:
-                print(e)
-                faillist.append(i)
-                count[1] += 1
+# version of the cfgs the stages build, part of every cache kind: bump it whenever a change to
+# CfgBuilder, CfgIdentify, CfgAnalysis or the stages changes the cfgs
+CFG_VERSION = 1
+
+# process pool settings, workers = 1 runs in the current process
+WORKERS = os.cpu_count()
+TIMEOUT = 600
+CHUNKSIZE = 16
+# rows read ahead of the pool
+STREAMCHUNK = 256
+
+builder = None
+identify = None
+contracttimeout = None
+
+
+class ContractTimeout(BaseException):
+    # not an Exception, so the except Exception blocks of the builder cannot swallow the alarm
+    pass
+
+
+def initworker(limit):
+    # every worker owns its builder and log file
+    global builder, identify, contracttimeout
+    date = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    builder = CfgBuilder("{}-{}".format(date, os.getpid()))
+    identify = CfgIdentify()
+    contracttimeout = limit
+
+
+@contextmanager
+def timelimit(seconds):
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def handler(signum, frame):
+        raise ContractTimeout("exceeded {}s".format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def rawstage(address, bytecode):
+    bytecode = BytecodeCleaner.removeInfo(bytecode)
+    cfg = builder.buildCfg(address, bytecode)
+    return [json.dumps(cfg.storejson())]
+
+
+def identifiedstage(address, bytecode):
+    if not isinstance(bytecode, str):
+        raise ValueError(f"Bytecode for {address} is not a string (is {type(bytecode)}). Skipping.")
+    bytecode = BytecodeCleaner.removeInfo(bytecode)
+    cfg = builder.buildCfg(address, bytecode)
+    cfg = identify.identify(cfg)
+    return [json.dumps(cfg.storejson())]
+
+
+def filterstage(address, blockjson):
+    cfg = builder.rebuildCfg(blockjson)
+    analysis = CfgAnalysis(cfg)
+    analysis.analyse()
+    return [json.dumps(analysis.cfg.storejson())]
+
+
+def icwsstage(address, blockjson):
+    cfg = builder.rebuildCfg(blockjson)
+    analysis = CfgAnalysis(cfg)
+    analysis.analyse_icws()
+    return [json.dumps(analysis.cfg.storejson())]
+
+
+def analysedvariant(cfg, analyse):
+    analysis = CfgAnalysis(builder.copyCfg(cfg))
+    analyse(analysis)
+    return json.dumps(analysis.cfg.storejson())
+
+
+def fusedstage(address, bytecode):
+    # one disassembly and build per contract, the other variants are derived from in-memory copies.
+    # A failing analysis only loses its own variant, as with the separate stages: its entry is a
+    # {"failed": reason} marker and raw/identified are still written
+    if not isinstance(bytecode, str):
+        raise ValueError(f"Bytecode for {address} is not a string (is {type(bytecode)}). Skipping.")
+    bytecode = BytecodeCleaner.removeInfo(bytecode)
+    cfg = builder.buildCfg(address, bytecode)
+    raw = json.dumps(cfg.storejson())
+    cfg = identify.identify(cfg)
+    identified = json.dumps(cfg.storejson())
+    variants = []
+    timedout = None
+    for analyse in (CfgAnalysis.analyse, CfgAnalysis.analyse_icws):
+        if timedout is not None:
+            # the time limit is spent, the variants left are not started
+            variants.append({"failed": timedout})
+            continue
+        try:
+            variants.append(analysedvariant(cfg, analyse))
+        except ContractTimeout as e:
+            timedout = "{}: {}".format(type(e).__name__, e)
+            variants.append({"failed": timedout})
+        except Exception as e:
+            variants.append({"failed": "{}: {}".format(type(e).__name__, e)})
+    return [raw, raw, identified] + variants
+
+
+def runone(task):
+    stage, address, payload = task
+    try:
+        with timelimit(contracttimeout):
+            blockjsons = stage(address, payload)
+        return address, blockjsons, None
+    except (ContractTimeout, Exception) as e:
+        return address, None, "{}: {}".format(type(e).__name__, e)
+
+
+def loadcheckpoint(outputs):
+    # the output files are their own checkpoint: rows are written in the same order to every
+    # output, so keep the rows common to all of them and drop anything after, including torn rows
+    rows = []
+    for output in outputs:
+        complete = []
+        if os.path.exists(output):
+            with open(output, "rb") as fp:
+                fp.readline()
+                for line in iter(fp.readline, b""):
+                    if not line.endswith(b"\n"):
+                        break
+                    complete.append((line.split(b",", 1)[0].decode(), fp.tell()))
+        rows.append(complete)
+    n = min(len(complete) for complete in rows)
+    for output, complete in zip(outputs, rows):
+        if os.path.exists(output):
+            with open(output, "rb+") as fp:
+                fp.truncate(complete[n - 1][1] if n else len(fp.readline()))
+    return set(address for address, end in rows[0][:n])
+
+
+def loadfaillist(stagename, keep=True, variants=()):
+    # structured fail list shared by all stages: address, stage, reason.
+    # variants are the stage names of single outputs a stage can fail on, dropped along with it
+    failed = set()
+    if not os.path.exists(failpath):
+        return failed
+    with open(failpath, newline="") as fp:
+        rows = list(csv.DictReader(fp))
+    if not keep:
+        rows = [row for row in rows if row["stage"] != stagename and row["stage"] not in variants]
+        with open(failpath, "w", newline="") as fp:
+            writer = csv.DictWriter(fp, fieldnames=['address', 'stage', 'reason'])
+            writer.writeheader()
+            writer.writerows(rows)
+    for row in rows:
+        if row["stage"] == stagename:
+            failed.add(row["address"])
+    return failed
+
+
+def contentkey(cache, address, payload, column):
+    # bytecode rows are keyed by the cleaned bytecode and bound to their address,
+    # cfg rows by the cfg they are derived from
+    if not isinstance(payload, str):
+        return None
+    if column == "bytecode":
+        key = digest(BytecodeCleaner.removeInfo(payload))
+        cache.bind(address, key)
+        return key
+    return payloaddigest(payload, address)
+
+
+def cachedresults(cache, kind, column, records, compute, buffer, read=True):
+    # per chunk: serve cached digests, compute every missing digest once and copy it to its clones.
+    # Without read every digest is computed again and its entry replaced.
+    for chunk in iterchunks(records, buffer):
+        keys = [contentkey(cache, address, payload, column) for address, payload in chunk]
+        owners = {}
+        tasks = []
+        for (address, payload), key in zip(chunk, keys):
+            if key is not None and key in owners:
+                continue
+            row = cache.lookup(kind, key) if read else None
+            if row is None:
+                tasks.append((address, payload))
+                if key is not None:
+                    owners[key] = (address, None)
             else:
-                count[0] += 1
-            finally:
+                owners[key] = (row[0], json.loads(row[1]))
+        computed = {address: (blockjsons, reason) for address, blockjsons, reason in compute(tasks)}
+        for (address, payload), key in zip(chunk, keys):
+            if key is None:
+                cache.record(kind, False)
+                yield (address,) + computed[address]
+                continue
+            owner, blockjsons = owners[key]
+            hit = blockjsons is not None or owner != address
+            if blockjsons is None:
+                blockjsons, reason = computed[owner]
+                if reason is not None:
+                    yield address, None, reason
+                    continue
+                # like whole failures, results with a failed variant are computed again next time
+                if all(isinstance(blockjson, str) for blockjson in blockjsons):
+                    cache.put(kind, key, json.dumps(blockjsons), owner)
+                owners[key] = (owner, blockjsons)
+            cache.record(kind, hit)
+            yield address, [renamecfg(blockjson, owner, address) if isinstance(blockjson, str) else blockjson
+                            for blockjson in blockjsons], None
+        cache.commit()
+
+
+def runstage(stage, source, column, outputs, workers=WORKERS, timeout=TIMEOUT, chunksize=CHUNKSIZE, resume=True,
+             cache=cachepath):
+    start = time.time()
+    stagename = "+".join(os.path.basename(output) for output in outputs)
+    count = [0, 0, countrecords(source)]
+
+    if not resume:
+        for output in outputs:
+            if os.path.exists(output):
+                os.remove(output)
+    done = loadcheckpoint(outputs)
+    variants = [os.path.basename(output) for output in outputs] if len(outputs) > 1 else []
+    failed = loadfaillist(stagename, keep=resume, variants=variants)
+    skip = done | failed
+    count[0] = len(done)
+    count[1] = len(failed)
+    records = ((i, payload) for i, payload in iterrecords(source, column) if i not in skip)
+
+    newfaillist = not os.path.exists(failpath)
+    with ExitStack() as files:
+        writers = []
+        for output in outputs:
+            newoutput = not os.path.exists(output)
+            fp = files.enter_context(open(output, "a", newline=""))
+            writer = csv.DictWriter(fp, fieldnames=['address', 'basicblocks'])
+            if newoutput:
+                writer.writeheader()
+            writers.append((fp, writer))
+        ff = files.enter_context(open(failpath, "a", newline=""))
+        failwriter = csv.DictWriter(ff, fieldnames=['address', 'stage', 'reason'])
+        if newfaillist:
+            failwriter.writeheader()
+
+        pool = None
+        if workers > 1:
+            pool = Pool(workers, initializer=initworker, initargs=(timeout,))
+            compute = lambda chunk: pool.imap(runone, ((stage, i, payload) for i, payload in chunk), chunksize)
+        else:
+            initworker(timeout)
+            compute = lambda chunk: map(runone, ((stage, i, payload) for i, payload in chunk))
+        # imap would drain the whole task generator up front, feed it a bounded chunk at a time
+        buffer = max(STREAMCHUNK, chunksize * workers * 4)
+        if cache:
+            cache = files.enter_context(CfgCache(cache))
+            # resume=False is a full rebuild, cached results are not read either
+            results = cachedresults(cache, versioned(stagename, CFG_VERSION), column, records, compute, buffer,
+                                    read=resume)
+        else:
+            results = (result for chunk in iterchunks(records, buffer) for result in compute(chunk))
+        try:
+            # imap yields in input order, so rows land in dataset order
+            for address, blockjsons, reason in results:
+                if reason is None:
+                    for (fp, writer), output, blockjson in zip(writers, outputs, blockjsons):
+                        if isinstance(blockjson, dict):
+                            # empty marker row keeps the outputs aligned for loadcheckpoint,
+                            # readers skip it as a missing cfg
+                            print(address, blockjson["failed"])
+                            failwriter.writerow({"address": address, "stage": os.path.basename(output),
+                                                 "reason": blockjson["failed"]})
+                            blockjson = ""
+                        writer.writerow({"address": address, "basicblocks": blockjson})
+                    count[0] += 1
+                else:
+                    print(address, reason)
+                    failwriter.writerow({"address": address, "stage": stagename, "reason": reason})
+                    count[1] += 1
+                if sum(count[:2]) % chunksize == 0:
+                    for fp, writer in writers:
+                        fp.flush()
+                    ff.flush()
                 print(count)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        if cache:
+            cache.report()
     end = time.time()
     use = end - start
-    with open(dirpath + "/faillist.txt", "w") as f:
-        for i in faillist:
-            f.write(i + "\n")
+    print(stagename, use)
 
 
+def checktimeout(limit=0.2):
+    # regression check: a contract stuck in resolveOrphanJumps must land in the fail list as a
+    # ContractTimeout, not be caught as a stack error and written once it finally finishes
+    global failpath
+    import tempfile
+    from parse.SymbolicStack import SymbolicStack
+    execute = SymbolicStack.execuateOpcode
 
+    def stuck(self, opcode, operand=None):
+        time.sleep(limit)
+        return execute(self, opcode, operand)
 
-def generateremovedcfg():
-    start = time.time()
-    dataset = pd.read_csv(datapath, index_col="address")
-    count = [0, 0, TOTAL_NUM]
-    faillist = []
-
-    
-    with open(blockpath + "removedcfgs.csv", "w") as fp:
-        fieldnames = ['address', 'basicblocks']
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        builder = CfgBuilder()
-        for i in dataset.index:
-            bytecode = dataset.loc[i, "bytecode"]
-            bytecode = StringCleaner.removeInfo(bytecode)
-            try:
-                cfg = builder.buildCfg(i, bytecode)
-                blockjson = cfg.storejson()
-
-                x = {"address": i,
-                     "basicblocks": json.dumps(blockjson)}
-
-                writer.writerow(x)
-
-            except Exception as e:
-                print(e)
-                faillist.append(i)
-                count[1] += 1
-            else:
-                count[0] += 1
-            finally:
-                print(count)
-    end = time.time()
-    use = end - start
-    with open(dirpath + "/faillist.txt", "w") as f:
-        for i in faillist:
-            f.write(i + "\n")
+    saved = failpath
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "dataset.csv")
+        with open(source, "w", newline="") as fp:
+            writer = csv.DictWriter(fp, fieldnames=['address', 'bytecode'])
+            writer.writeheader()
+            writer.writerow({"address": "0xstuck", "bytecode": "6080604052600a565b005b"})
+        failpath = os.path.join(tmp, "faillist.csv")
+        SymbolicStack.execuateOpcode = stuck
+        try:
+            start = time.time()
+            runstage(rawstage, source, "bytecode", [os.path.join(tmp, "rawcfgs.csv")], workers=1,
+                     timeout=limit, cache=None)
+            use = time.time() - start
+        finally:
+            SymbolicStack.execuateOpcode = execute
+            failpath = saved
+        with open(os.path.join(tmp, "faillist.csv"), newline="") as fp:
+            failed = list(csv.DictReader(fp))
+    ok = len(failed) == 1 and failed[0]["reason"].startswith("ContractTimeout")
+    print("timeout reported: {}, {:.2f}s for a {}s limit".format(ok, use, limit))
+    return ok
 
 
+def generaterawcfg(**kwargs):
+    runstage(rawstage, datapath, "bytecode", [blockpath + "rawcfgs.csv"], **kwargs)
 
 
+def generateremovedcfg(**kwargs):
+    runstage(rawstage, datapath, "bytecode", [blockpath + "removedcfgs.csv"], **kwargs)
 
-def generateidentifiedcfgs():
-    start = time.time()
-    dataset = pd.read_csv(datapath, index_col="address")
-    count = [0, 0, TOTAL_NUM]
-    faillist = []
-
-    
-    with open(blockpath + "identifiedcfgs.csv", "w") as fp:
-        fieldnames = ['address', 'basicblocks']
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        builder = CfgBuilder()
-        identify = CfgIdentify()
-        for i in dataset.index:
-
-            
-            
-            
-            
-            try:
-                bytecode = dataset.loc[i, "bytecode"]
-
-                
-                if not isinstance(bytecode, str):
-                    raise ValueError(f"Bytecode for {i} is not a string (is {type(bytecode)}). Skipping.")
-
-                bytecode = StringCleaner.removeInfo(bytecode)
-
-                cfg = builder.buildCfg(i, bytecode)
-                cfg = identify.identify(cfg)
-                blockjson = cfg.storejson()
-
-                x = {"address": i,
-                     "basicblocks": json.dumps(blockjson)}
-
-                writer.writerow(x)
-
-            except Exception as e:
-                
-                print(e)
-                faillist.append(i)
-                count[1] += 1
-            else:
-                count[0] += 1
-            finally:
-                
-                print(count)
-    end = time.time()
-    use = end - start
-    with open(dirpath + "/faillist.txt", "w") as f:
-        for i in faillist:
-            f.write(i + "\n")
 
+def generateidentifiedcfgs(**kwargs):
+    runstage(identifiedstage, datapath, "bytecode", [blockpath + "identifiedcfgs.csv"], **kwargs)
+
+
+def generatefiltercfgs(**kwargs):
+    runstage(filterstage, blockpath + "identifiedcfgs.csv", "basicblocks", [blockpath + "filteredcfgs3.csv"], **kwargs)
 
-def generatefiltercfgs():
-    start = time.time()
-    dataset = pd.read_csv(blockpath + "identifiedcfgs.csv", index_col="address")
-
-    count = [0, 0, TOTAL_NUM]
-    faillist = []
-    with open(blockpath + "filteredcfgs3.csv", "w") as fp:
-        fieldnames = ['address', 'basicblocks']
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        builder = CfgBuilder()
-        for i in dataset.index:
-            try:
-                blockjson = dataset.loc[i, "basicblocks"]
-                cfg = builder.rebuildCfg(blockjson)
-                analysis = CfgAnalysis(cfg)
-                
-                analysis.analyse()
-
-                blockjson = analysis.cfg.storejson()
-                x = {"address": i,
-                     "basicblocks": json.dumps(blockjson)}
-
-                writer.writerow(x)
-
-            except Exception as e:
-                print(e)
-                faillist.append(i)
-                count[1] += 1
-            else:
-                count[0] += 1
-            finally:
-                print(count)
-    end = time.time()
-    use = end - start
-    with open(dirpath + "/faillist.txt", "w") as f:
-        for i in faillist:
-            f.write(i + "\n")
 
+def generateicws(**kwargs):
+    runstage(icwsstage, blockpath + "identifiedcfgs.csv", "basicblocks", [blockpath + "icwscfgs.csv"], **kwargs)
 
-def generateicws():
+
+def generateallcfgs(**kwargs):
+    # removedcfgs.csv has always been identical to rawcfgs.csv, both are written from the same build
+    outputs = ["rawcfgs.csv", "removedcfgs.csv", "identifiedcfgs.csv", "filteredcfgs3.csv", "icwscfgs.csv"]
+    runstage(fusedstage, datapath, "bytecode", [blockpath + output for output in outputs], **kwargs)
+
+
+def generatestore(input, output):
+    # columnar binary copy of a blocks csv, see parse/CfgStore.py
     start = time.time()
-    dataset = pd.read_csv(blockpath + "identifiedcfgs.csv", index_col="address")
-
-    count = [0, 0, TOTAL_NUM]
-    faillist = []
-    with open(blockpath + "icwscfgs.csv", "w") as fp:
-        fieldnames = ['address', 'basicblocks']
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        builder = CfgBuilder()
-        for i in dataset.index:
-            try:
-                blockjson = dataset.loc[i, "basicblocks"]
-                cfg = builder.rebuildCfg(blockjson)
-                analysis = CfgAnalysis(cfg)
-                
-                analysis.analyse_icws()
-
-                blockjson = analysis.cfg.storejson()
-                x = {"address": i,
-                     "basicblocks": json.dumps(blockjson)}
-
-                writer.writerow(x)
-
-            except Exception as e:
-                print(e)
-                faillist.append(i)
-                count[1] += 1
-            else:
-                count[0] += 1
-            finally:
-                print(count)
+    with CfgStoreWriter(blockpath + output) as writer:
+        for i, blockjson in iterrecords(blockpath + input, "basicblocks"):
+            if blockjson is None:
+                # marker row of a variant that failed, see fusedstage
+                continue
+            writer.add(json.loads(blockjson), address=i)
     end = time.time()
     use = end - start
-    with open(dirpath + "/faillist.txt", "w") as f:
-        for i in faillist:
-            f.write(i + "\n")
-
+    print(output, use)
 
 
 if __name__ == "__main__":
-    generaterawcfg()
-    generateremovedcfg()
-    generateidentifiedcfgs()
-    generatefiltercfgs()
-    generateicws()
+    generateallcfgs()
+    generatestore("rawcfgs.csv", "rawcfgs.cfgstore")
+    generatestore("identifiedcfgs.csv", "identifiedcfgs.cfgstore")
+    generatestore("filteredcfgs3.csv", "filteredcfgs3.cfgstore")
+    generatestore("icwscfgs.csv", "icwscfgs.cfgstore")
@@ -1,16 +1,22 @@
 from pyevmasm.evmasm import Instruction
 from parse.BlockType import BlockType
+from parse.opcodes import Op, OPCODES, POPS, PUSHES, IS_TERMINATOR, IS_BRANCH, IS_CALL, JUMP, JUMPI
+from array import array
 
 
 class BasicBlock:
-    __slots__ = ['_offset', '_instructions', '_predecessors', '_successors', '_stackBalance', '_blocktype',
-                 '_hascaller', '_retain']
+    # instructions are kept as parallel arrays: opcode bytes, pcs, and the operands by index
+    # edges are dicts used as insertion ordered sets, so adding an edge is O(1) and the order stays the insertion order
+    __slots__ = ['_offset', '_opcodes', '_pcs', '_operands', '_predecessors', '_successors', '_stackBalance',
+                 '_blocktype', '_hascaller', '_retain']
 
     def __init__(self, offset):
         self._offset = offset
-        self._instructions = []
-        self._predecessors = []
-        self._successors = []
+        self._opcodes = array('B')
+        self._pcs = array('I')
+        self._operands = {}
+        self._predecessors = {}
+        self._successors = {}
         self._stackBalance = 0
         self._blocktype = BlockType.UNDEFINED
         self._hascaller = None
@@ -18,34 +24,68 @@ class BasicBlock:
 
     def calculateStackBalance(self) -> int:
         balance = 0
-        for o in self._instructions:
-            balance -= o.pops
-            balance += o.pushes
+        for o in self._opcodes:
+            balance -= POPS[o]
+            balance += PUSHES[o]
         return balance
 
+    def add_op(self, opcode, pc, operand=None, balance=True):
+        if operand is not None:
+            self._operands[len(self._opcodes)] = operand
+        self._opcodes.append(opcode)
+        self._pcs.append(pc)
+        if balance:
+            self._stackBalance += PUSHES[opcode] - POPS[opcode]
+
     def add_instruction(self, instruction):
-        self._instructions.append(instruction)
-        if hasattr(instruction, "pops"):
-            self._stackBalance -= instruction.pops
-            self._stackBalance += instruction.pushes
+        # pyevmasm instructions carry their stack effect, entity.Instruct read from json does not
+        opcode = instruction.opcode if hasattr(instruction, "opcode") else OPCODES.get(instruction.name, 0xfe)
+        self.add_op(opcode, instruction.pc, instruction.operand, hasattr(instruction, "pops"))
 
     def add_All(self, instructions: list):
-        self._instructions.extend(instructions)
+        for instruction in instructions:
+            self.add_instruction(instruction)
+        self._stackBalance = self.calculateStackBalance()
+
+    def setops(self, opcodes, pcs, operands):
+        # takes over decoded arrays, see parse/decoder.py
+        self._opcodes = opcodes
+        self._pcs = pcs
+        self._operands = operands
         self._stackBalance = self.calculateStackBalance()
 
+    def copyops(self, other: 'BasicBlock'):
+        # instructions only, the stack balance is left as it is
+        self._opcodes.extend(other._opcodes)
+        self._pcs.extend(other._pcs)
+        self._operands.update(other._operands)
+
     def __repr__(self):
         if self.type == BlockType.STOP:
             return '<STOP BLOCK>'
-        return '<cfg BasicBlock@{:x}-{:x}> {}'.format(self.start.pc, self.end.pc, self.type)
+        return '<cfg BasicBlock@{:x}-{:x}> {}'.format(self._pcs[0], self._pcs[-1], self.type)
 
     def __str__(self) -> str:
         if self.type == BlockType.STOP:
             return '<STOP BLOCK>'
-        return '<cfg BasicBlock@{:x}-{:x}> {}'.format(self.start.pc, self.end.pc, self.type)
+        return '<cfg BasicBlock@{:x}-{:x}> {}'.format(self._pcs[0], self._pcs[-1], self.type)
 
     def getInstruction(self, index):
         if index < self.length and index >= self.length * -1:
-            return self._instructions[index]
+            if index < 0:
+                index += self.length
+            return Op(self._opcodes[index], self._pcs[index], self._operands.get(index))
+
+    def opcode(self, index):
+        # opcode byte at index, negative indexes count from the end, None when out of range
+        if index < self.length and index >= self.length * -1:
+            return self._opcodes[index]
+
+    def iterops(self):
+        """Yield (opcode, pc, operand) for every instruction."""
+        operands = self._operands
+        for i, (opcode, pc) in enumerate(zip(self._opcodes, self._pcs)):
+            yield opcode, pc, operands.get(i)
 
     @property
     def offset(self):
@@ -56,26 +96,38 @@ class BasicBlock:
 
     @property
     def instructions(self):
-        return self._instructions
+        return [Op(opcode, pc, operand) for opcode, pc, operand in self.iterops()]
+
+    @property
+    def opcodes(self):
+        return self._opcodes
+
+    @property
+    def pcs(self):
+        return self._pcs
+
+    @property
+    def operands(self):
+        return self._operands
 
     @property
     def length(self):
-        return len(self._instructions)
+        return len(self._opcodes)
 
     @property
-    def start(self) -> Instruction:
+    def start(self) -> Op:
         if self.length:
-            return self._instructions[0]
+            return self.getInstruction(0)
 
     @property
-    def end(self) -> Instruction:
+    def end(self) -> Op:
         if self.length:
-            return self._instructions[-1]
+            return self.getInstruction(-1)
 
     @property
-    def lastsecond(self) -> Instruction:
+    def lastsecond(self) -> Op:
         if self.length > 1:
-            return self._instructions[-2]
+            return self.getInstruction(-2)
         return None
 
     @property
@@ -104,11 +156,11 @@ class BasicBlock:
 
     @property
     def predecessors(self):
-        return self._predecessors
+        return list(self._predecessors)
 
     @property
     def successors(self):
-        return self._successors
+        return list(self._successors)
 
     def hasSuccessor(self):
         return len(self._successors) > 0
@@ -119,33 +171,37 @@ class BasicBlock:
     def add_successor(self, next: 'BasicBlock'):
         if next.offset == self.offset or next.offset == 0:
             return
-        if next not in self._successors:
-            self._successors.append(next)
-        if self not in next._predecessors:
-            next._predecessors.append(self)
+        self._successors[next] = None
+        next._predecessors[self] = None
+
+    def setcaller(self, flag: bool):
+        self._hascaller = flag
+
+    def setstackbalance(self, balance: int):
+        self._stackBalance = balance
 
     def checkcaller(self):
-        for i in self._instructions:
-            if "CALL" in i.name:
+        for o in self._opcodes:
+            if IS_CALL[o]:
                 self._hascaller = True
                 return
         self._hascaller = False
 
     @property
     def ends_with_jump(self):
-        return self.end.name == 'JUMP'
+        return self._opcodes[-1] == JUMP
 
     @property
     def ends_with_jumpi(self):
-        return self.end.name == 'JUMPI'
+        return self._opcodes[-1] == JUMPI
 
     @property
     def ends_with_jump_or_jumpi(self):
-        return self.end.is_branch()
+        return bool(IS_BRANCH[self._opcodes[-1]])
 
     @property
     def is_terminator(self):
-        return self.end.is_terminator
+        return bool(IS_TERMINATOR[self._opcodes[-1]])
 
     def has_caller(self):
         if self._hascaller == True:
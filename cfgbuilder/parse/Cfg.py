@@ -1,6 +1,9 @@
 from parse.entity import OrderDict, Triplet
 from parse.BlockType import BlockType
 from parse.BasicBlock import BasicBlock
+from parse.opcodes import NAMES
+from parse.CfgGraph import CfgGraph
+import numpy as np
 import re
 
 removedig = re.compile(r'[0-9]+')
@@ -57,8 +60,8 @@ class Cfg:
             offset: int = pair.key
             basicblock: BasicBlock = pair.value
             ins = []
-            for i in basicblock.instructions:
-                ins.append({"pc": i.pc, "opname": i.name, "operand": i.operand})
+            for opcode, pc, operand in basicblock.iterops():
+                ins.append({"pc": pc, "opname": NAMES[opcode], "operand": operand})
             pres = []
             succs = []
             for p in basicblock.predecessors:
@@ -81,6 +84,19 @@ class Cfg:
             basicblocksdict["short"] = self.short
         return basicblocksdict
 
+    def tograph(self) -> CfgGraph:
+        # same graph as CfgGraph.fromblocks(self.storejson()["basicblocks"]), without the json
+        blocks = [pair.value for pair in self.basicBlocks]
+        ids = {block.offset: i for i, block in enumerate(blocks)}
+        edges = [(ids[block.offset], ids[successor.offset]) for block in blocks for successor in block.successors]
+        attrs = {"offset": np.array([block.offset for block in blocks], dtype=np.int64),
+                 "retain": np.array([block.retain for block in blocks], dtype=bool)}
+        return CfgGraph.fromedges(len(blocks), edges, attrs)
+
+    def storebinary(self, writer):
+        # writer is a parse.CfgStore.CfgStoreWriter
+        writer.add(self.storejson())
+
     def extract_list(self):
         basicblocks: BasicBlock = self.basicBlocks
         instructionlist = []
@@ -2,6 +2,7 @@ from parse.Cfg import Cfg
 from parse.BlockType import BlockType
 from parse.BasicBlock import BasicBlock
 from parse.entity import OrderDict,Triplet,Stack,Logger
+from parse.opcodes import NAMES,IS_PUSH,JUMPI,ISZERO,CALLVALUE,JUMPDEST
 import re
 BLOCK_LENGTH = 100
 DISPATCHER_LENGTH = 1
@@ -90,11 +91,12 @@ class CfgAnalysis:
                 block.setretain(False)
     
     def is_zero_fallback(self,block:BasicBlock):
-        if block.length>=5 and block.getInstruction(-1).name == "JUMPI" and\
-                    "PUSH" in block.getInstruction(-2).name and \
-                    block.getInstruction(-3).name == "ISZERO" and \
-                    block.getInstruction(-4).name == "CALLVALUE" and\
-                    block.getInstruction(-5).name == "JUMPDEST":
+        ops = block.opcodes
+        if block.length>=5 and ops[-1] == JUMPI and\
+                    IS_PUSH[ops[-2]] and \
+                    ops[-3] == ISZERO and \
+                    ops[-4] == CALLVALUE and\
+                    ops[-5] == JUMPDEST:
             return True
         return False
     
@@ -105,10 +107,9 @@ class CfgAnalysis:
         for pair in blocks:
             block:BasicBlock = pair.value
             if block.retain:
-                ins = block.instructions
                 blocklist = []
-                for i in ins:
-                    instr = i.name
+                for o in block.opcodes:
+                    instr = NAMES[o]
                     word = removedig.sub('',instr)
                     if word != "":
                         blocklist.append(word)
@@ -6,6 +6,9 @@ from parse.BlockType import BlockType
 from parse.BasicBlock import BasicBlock
 from parse.SymbolicStack import SymbolicStack
 from parse.entity import OrderDict,Triplet,Stack,Logger,Instruct
+from parse.CfgStore import CfgStoreReader,RETAIN,HASCALLER
+from parse import decoder
+from parse.opcodes import OPCODES,SIZES,IS_TERMINATOR,IS_PUSH,JUMP,JUMPI,JUMPDEST
 import json,os
 
 
@@ -18,20 +21,27 @@ class CfgBuilder:
     LOOP_DEPTH = 1000
     REMOVE_ORPHAN_BLOCKS = True
     BLOCK_LIMIT = 200000
+    # decode with parse/decoder.py instead of pyevmasm.disassemble_all
+    FAST_DECODE = True
 
-    def __init__(self):
-        date = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-        self.log = Logger(date)
+    def __init__(self,logname=None):
+        if logname is None:
+            logname = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.log = Logger(logname)
 
     def buildCfg(self,name,bytecode) -> Cfg:
-        if bytecode == '':
+        if len(bytecode) == 0:
             return None
         
         self.name = name
-        # 反汇编
-        opcode = self.disassemble(bytecode)
-        # 生成基本快
-        blocks = self.generateBasicBlocks(opcode)
+        if CfgBuilder.FAST_DECODE:
+            # 查表解码，直接得到基本块
+            blocks = self.decodeBasicBlocks(bytecode)
+        else:
+            # 反汇编
+            opcode = self.disassemble(bytecode)
+            # 生成基本快
+            blocks = self.generateBasicBlocks(opcode)
         # 解析后续节点
         self.calculateSuccessors(blocks)
         # 解析跳转
@@ -46,8 +56,10 @@ class CfgBuilder:
 
     # Disassembling bytecode into opcodes
     def disassemble(self,bytecode):
-        if isinstance(bytecode, str):
-            bytecode = bytecode.replace('\n', '')
+        if not isinstance(bytecode, str):
+            # 已解码的字节，如 BytecodeCleaner 返回的 memoryview
+            return disassemble_all(bytes(bytecode))
+        bytecode = bytecode.replace('\n', '')
         if bytecode.startswith('0x'):
             bytecode = bytes.fromhex(bytecode[2:])
         else:
@@ -59,57 +71,67 @@ class CfgBuilder:
         result = OrderDict()
         current = BasicBlock(0)
         for op in opcode:
-            if op.is_terminator:
-                current.add_instruction(op)
+            code = op.opcode
+            if IS_TERMINATOR[code]:
+                current.add_op(code,op.pc,op.operand)
                 result.update(current.offset,current)
                 current = BasicBlock(op.pc + 1)
-            elif op.semantics == "JUMPDEST" and not current.isEmpty():
+            elif code == JUMPDEST and not current.isEmpty():
                 result.update(current.offset,current)
                 current = BasicBlock(op.pc)
-                current.add_instruction(op)
+                current.add_op(code,op.pc,op.operand)
             else:
-                current.add_instruction(op)
+                current.add_op(code,op.pc,op.operand)
         if not current.isEmpty():
             result.update(current.offset,current)
         return result
 
+    # Same blocks as generateBasicBlocks(disassemble(bytecode)), without Instruction objects
+    def decodeBasicBlocks(self,bytecode) -> OrderDict:
+        result = OrderDict()
+        for offset,opcodes,pcs,operands in decoder.blocks(bytecode):
+            block = BasicBlock(offset)
+            block.setops(opcodes,pcs,operands)
+            result.update(offset,block)
+        return result
+
     # Build connections between basic blocks
     def calculateSuccessors(self,basicblocks:'OrderDict'):
         for pair in basicblocks:
             offset = pair.key
             basicblock:BasicBlock = pair.value
-            ins:list = basicblock.instructions
-            lastin:Instruction = basicblock.end
+            ops = basicblock.opcodes
+            length = len(ops)
+            last = ops[-1]
+            lastpc = basicblock.pcs[-1]
             #JUMP
-            if lastin.name == "JUMP" and len(ins) > 1:
+            if last == JUMP and length > 1:
                 #PUSH
-                lastsecond:Instruction = ins[-2]
-                if lastsecond.group == "Push Operations":
-                    jumpoffset = lastsecond.operand
-                    if jumpoffset in basicblocks.keys():
+                if IS_PUSH[ops[-2]]:
+                    jumpoffset = basicblock.operands.get(length - 2)
+                    if jumpoffset in basicblocks:
                         basicblock.add_successor(basicblocks.get(jumpoffset))
                     else:
                         self.log.addDirectJumpTargetErrors(self.name,offset,jumpoffset)
                 else:
                     pass
             #JUMPI
-            elif lastin.name == "JUMPI" and len(ins) > 1:
+            elif last == JUMPI and length > 1:
                 #NEXT
-                nextoffset = lastin.pc + lastin.size
+                nextoffset = lastpc + SIZES[last]
                 nextblock:BasicBlock = basicblocks.get(nextoffset)
                 if(nextblock is not None):
                     basicblock.add_successor(nextblock)
                 #PUSH
-                lastsecond:Instruction = ins[-2]
-                if lastsecond.group == "Push Operations":
-                    jumpoffset = lastsecond.operand
-                    if jumpoffset in basicblocks.keys():
+                if IS_PUSH[ops[-2]]:
+                    jumpoffset = basicblock.operands.get(length - 2)
+                    if jumpoffset in basicblocks:
                         basicblock.add_successor(basicblocks.get(jumpoffset))
                     else:
                         self.log.addDirectJumpTargetErrors(self.name,offset,jumpoffset)
                         
             #other terminator
-            elif lastin.is_terminator:
+            elif IS_TERMINATOR[last]:
                 pass
             
             #last instruction
@@ -117,8 +139,8 @@ class CfgBuilder:
                 pass
             #ELSE commom block next
             else:
-                jumpoffset = lastin.pc + lastin.size
-                if jumpoffset in basicblocks.keys():
+                jumpoffset = lastpc + SIZES[last]
+                if jumpoffset in basicblocks:
                     basicblock.add_successor(basicblocks.get(jumpoffset))
 
     # Dynamic execution of simulation stacks
@@ -138,25 +160,26 @@ class CfgBuilder:
             dfs_depth = element.elem3
             # print(current)
 
+            ops = current.opcodes
+            operands = current.operands
             #execuate all instructions in block except the last one
             for i in range(current.length-1):
-                op:Instruction = current.getInstruction(i)
                 # print(op,stack)
                 try:
-                    stack.execuate(op)
+                    stack.execuateOpcode(ops[i],operands.get(i))
                 except Exception as e:
-                    self.log.addStackExceededErrors(self.name,current.offset,op.pc)
+                    self.log.addStackExceededErrors(self.name,current.offset,current.pcs[i])
                     if current.offset in errors:
                         errors[current.offset] += 1
                     else:
                         errors[current.offset] = 1
                     
             
-            lastin:Instruction = current.end
+            last = ops[-1]
             nextoffset = 0
             
             #check orphan jump and reslove
-            if lastin.name == "JUMP":
+            if last == JUMP:
                 try:
                     nextoffset = stack.peek()
                     if nextoffset != 0 and nextoffset != None:
@@ -167,7 +190,7 @@ class CfgBuilder:
                             self.log.addOrphanJumpTargetNullErrors(self.name,current.offset,nextoffset)
                     else:
                         raise Exception()
-                except:
+                except Exception:
                     self.log.addOrphanJumpTargetUnknownErrors(self.name,current.offset)
             
             #execute last instruction
@@ -176,10 +199,10 @@ class CfgBuilder:
                 self.log.addBlockLimitErrors(self.name,CfgBuilder.BLOCK_LIMIT)
                 return
             try:
-                stack.execuate(lastin)
+                stack.execuateOpcode(last,operands.get(current.length-1))
                 # print(stack)
             except Exception as e:
-                self.log.addStackExceededErrors(self.name,current.offset,lastin.pc)
+                self.log.addStackExceededErrors(self.name,current.offset,current.pcs[-1])
                 if current.offset in errors:
                     errors[current.offset] += 1
                 else:
@@ -189,7 +212,7 @@ class CfgBuilder:
             
             if dfs_depth < CfgBuilder.LOOP_DEPTH:
                 # next block 
-                if lastin.name != "JUMP":
+                if last != JUMP:
                     for successor in current.successors:
                         edge = Triplet(current.offset,successor.offset,stack)
                         if (edge not in visited) and ((current.offset not in errors) or errors[current.offset] < 50):
@@ -226,10 +249,9 @@ class CfgBuilder:
                     queue.push(successor)
 
         # remove higher offset blocks
-        offsetlist = list(basicblocks.keys())
+        offsetlist = [pair.key for pair in basicblocks.between(candidateOffset + 1)]
         for offset in offsetlist:
-            if offset > candidateOffset:
-                basicblocks.remove(offset)
+            basicblocks.remove(offset)
 
         # remove other blocks
         removelist = []
@@ -262,8 +284,8 @@ class CfgBuilder:
             instructions = block["instructions"]
             newblock = BasicBlock(offset)
             for instruction in instructions:
-                ins = Instruct(instruction["pc"],instruction["opname"],instruction["operand"])
-                newblock.add_instruction(ins)
+                # json carries no stack effect, the balance stays 0 as with entity.Instruct
+                newblock.add_op(OPCODES.get(instruction["opname"],0xfe),instruction["pc"],instruction["operand"],False)
             newblock.setType(BlockType[block["blocktype"]])
             basicblocks.update(offset,newblock)
         for block in blocks:
@@ -278,3 +300,55 @@ class CfgBuilder:
         cfg.loaddata(blockdict["dispatchers"],blockdict["fallbacks"],blockdict["functions"],blockdict["loaders"],blockdict["short"])
         return cfg
             
+
+    # 在内存中复制cfg，结果与 rebuildCfg(json.dumps(cfg.storejson())) 相同，但不经过json编解码
+    def copyCfg(self,cfg:Cfg)->Cfg:
+        basicblocks = OrderDict()
+        for pair in cfg.basicblocks:
+            offset = pair.key
+            block:BasicBlock = pair.value
+            newblock = BasicBlock(offset)
+            newblock.copyops(block)
+            newblock.setType(block.type)
+            basicblocks.update(offset,newblock)
+        for pair in cfg.basicblocks:
+            current:BasicBlock = basicblocks.get(pair.key)
+            for successor in pair.value.successors:
+                next = basicblocks.get(successor.offset)
+                if next is not None:
+                    current.add_successor(next)
+        newcfg = Cfg(cfg.name,basicblocks)
+        newcfg.loaddata(list(cfg.dispatchers),list(cfg.fallbacks),list(cfg.functions),list(cfg.loaders),cfg.short)
+        return newcfg
+
+    # 从二进制cfg存储中读取单个合约，保留retain/hascaller/stackbalance
+    def loadCfg(self,reader:CfgStoreReader,address)->Cfg:
+        arrays = reader.arrays(address)
+        record = arrays["record"]
+        offsets = arrays["offset"].tolist()
+        types = arrays["type"].tolist()
+        flags = arrays["flags"].tolist()
+        balances = arrays["stackbalance"].tolist()
+        instptr = arrays["inst_ptr"].tolist()
+        succptr = arrays["succ_ptr"].tolist()
+        targets = arrays["succ_target"].tolist()
+        opcodes = arrays["opcode"].tolist()
+        pcs = arrays["pc"].tolist()
+        basicblocks = OrderDict()
+        newblocks = []
+        for b,offset in enumerate(offsets):
+            newblock = BasicBlock(offset)
+            for i in range(instptr[b],instptr[b+1]):
+                newblock.add_op(opcodes[i],pcs[i],CfgStoreReader.operand(arrays,i),False)
+            newblock.setType(BlockType(types[b]))
+            newblock.setretain(bool(flags[b] & RETAIN))
+            newblock.setcaller(bool(flags[b] & HASCALLER))
+            newblock.setstackbalance(balances[b])
+            basicblocks.update(offset,newblock)
+            newblocks.append(newblock)
+        for b,current in enumerate(newblocks):
+            for t in targets[succptr[b]:succptr[b+1]]:
+                current.add_successor(newblocks[t])
+        cfg = Cfg(record["contractname"],basicblocks)
+        cfg.loaddata(record["dispatchers"],record["fallbacks"],record["functions"],record["loaders"],record["short"])
+        return cfg
@@ -0,0 +1,104 @@
+import hashlib, json, os, sqlite3
+
+# Content-addressed cache for pipeline results.
+# Entries are keyed by (kind, digest). The digest is the sha256 of the payload a stage consumes:
+# the cleaned bytecode bytes (after BytecodeCleaner.removeInfo) for the cfg stages, the cfg json
+# without its contract name (payloaddigest) for the stages reading cfgs. Byte-identical clones share
+# one entry and a run only computes new or changed payloads. The contracts table binds every
+# address to its bytecode digest.
+# kind names the result, e.g. the output file of a stage, and the version of the code computing it
+# (versioned), so variants never mix and a code change never serves results of the former code.
+# This module only depends on the standard library so it can be shared outside cfgbuilder.
+
+
+def digest(text):
+    if isinstance(text, str):
+        text = text.encode()
+    return hashlib.sha256(text).hexdigest()
+
+
+def payloaddigest(blockjson, address):
+    # cfg json starts with the contract it was built for, leave the name out so clones share the key
+    name = '{"contractname": ' + json.dumps(address)
+    if blockjson.startswith(name):
+        blockjson = blockjson[len(name):]
+    return digest(blockjson)
+
+
+def versioned(kind, version):
+    # bump the version of a stage whenever a change of its code changes its results
+    return "{}:v{}".format(kind, version)
+
+
+def renamecfg(blockjson, owner, address):
+    # cfg json starts with the contract it was built for, swap in the address it is reused for
+    old = '{"contractname": ' + json.dumps(owner)
+    if owner == address or not blockjson.startswith(old):
+        return blockjson
+    return '{"contractname": ' + json.dumps(address) + blockjson[len(old):]
+
+
+class CfgCache:
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS contracts (address TEXT PRIMARY KEY, digest TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries "
+                        "(kind TEXT, digest TEXT, owner TEXT, value TEXT, PRIMARY KEY (kind, digest))")
+        self.hits = {}
+        self.misses = {}
+
+    def bind(self, address, key):
+        self.db.execute("INSERT OR REPLACE INTO contracts VALUES (?, ?)", (address, key))
+
+    def digestof(self, address):
+        row = self.db.execute("SELECT digest FROM contracts WHERE address = ?", (address,)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, kind, key):
+        """Return (owner, value) of an entry or None."""
+        if key is None:
+            return None
+        return self.db.execute("SELECT owner, value FROM entries WHERE kind = ? AND digest = ?",
+                               (kind, key)).fetchone()
+
+    def record(self, kind, hit):
+        counter = self.hits if hit else self.misses
+        counter[kind] = counter.get(kind, 0) + 1
+
+    def get(self, kind, key):
+        # lookup that also counts the hit or miss
+        row = self.lookup(kind, key)
+        self.record(kind, row is not None)
+        return row[1] if row else None
+
+    def put(self, kind, key, value, owner=None):
+        if key is not None:
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (kind, key, owner, value))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def ratio(self, kind):
+        hits = self.hits.get(kind, 0)
+        total = hits + self.misses.get(kind, 0)
+        return hits / total if total else 0.0
+
+    def report(self):
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits.get(kind, 0)
+            misses = self.misses.get(kind, 0)
+            print("cache {}: {} hits / {} misses, hit ratio {:.2%}".format(kind, hits, misses, self.ratio(kind)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,236 @@
+import numpy as np
+
+# Integer graph model of a cfg, shared by cfgbuilder and cfg2vec.
+# Nodes are dense ids 0..n-1, edges are CSR arrays in both directions:
+#   succ[succptr[i]:succptr[i + 1]]   successors of i in insertion order
+#   pred[predptr[i]:predptr[i + 1]]   predecessors of i in insertion order
+# Per node attributes (block offset, retain flag, ...) are arrays in attrs.
+# Edge order follows networkx.DiGraph for the same sequence of operations, so nodes(), edges() and
+# neighbors() give the lists generategraph and WeisfeilerLehmanHashing got from networkx.
+# Operations that change the graph return a new graph with compacted ids.
+# This module only depends on numpy so it can be shared outside cfgbuilder.
+
+
+def _csr(lists):
+    ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([len(l) for l in lists])
+    flat = np.array([j for l in lists for j in l], dtype=np.int32)
+    return ptr, flat
+
+
+class CfgGraph:
+    __slots__ = ['succptr', 'succ', 'predptr', 'pred', 'attrs']
+
+    def __init__(self, succptr, succ, predptr, pred, attrs=None):
+        self.succptr = succptr
+        self.succ = succ
+        self.predptr = predptr
+        self.pred = pred
+        self.attrs = attrs if attrs is not None else {}
+
+    @staticmethod
+    def fromlists(succs, preds, attrs=None):
+        """Build a graph from per node successor and predecessor lists."""
+        succptr, succ = _csr(succs)
+        predptr, pred = _csr(preds)
+        return CfgGraph(succptr, succ, predptr, pred, attrs)
+
+    @staticmethod
+    def fromedges(n, edges, attrs=None):
+        """Build a graph of n nodes from (source, target) pairs, repeated edges are added once."""
+        succs = [{} for i in range(n)]
+        preds = [{} for i in range(n)]
+        for i, j in edges:
+            if j not in succs[i]:
+                succs[i][j] = None
+                preds[j][i] = None
+        return CfgGraph.fromlists(succs, preds, attrs)
+
+    @staticmethod
+    def fromlabels(nodes, edges):
+        """Build a graph from node labels and labelled edges, ids are given in order of appearance
+        like networkx add_nodes_from + add_edges_from. The labels are kept in attrs["label"]."""
+        ids = {}
+        for node in nodes:
+            ids.setdefault(node, len(ids))
+        pairs = []
+        for i, j in edges:
+            pairs.append((ids.setdefault(i, len(ids)), ids.setdefault(j, len(ids))))
+        return CfgGraph.fromedges(len(ids), pairs, {"label": list(ids)})
+
+    @staticmethod
+    def fromblocks(basicblocks):
+        """Build a graph from the "basicblocks" list of Cfg.storejson(), one node per block in order."""
+        ids = {block["offset"]: i for i, block in enumerate(basicblocks)}
+        edges = [(ids[block["offset"]], ids[suc]) for block in basicblocks for suc in block["successors"]]
+        attrs = {"offset": np.array([block["offset"] for block in basicblocks], dtype=np.int64),
+                 "retain": np.array([block["retain"] for block in basicblocks], dtype=bool)}
+        return CfgGraph.fromedges(len(basicblocks), edges, attrs)
+
+    def __len__(self):
+        return len(self.succptr) - 1
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __contains__(self, node):
+        return 0 <= node < len(self)
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        return len(self.succ)
+
+    def nodes(self):
+        return range(len(self))
+
+    def edges(self):
+        sources = np.repeat(np.arange(len(self)), np.diff(self.succptr))
+        return list(zip(sources.tolist(), self.succ.tolist()))
+
+    def successors(self, node):
+        return self.succ[self.succptr[node]:self.succptr[node + 1]].tolist()
+
+    def predecessors(self, node):
+        return self.pred[self.predptr[node]:self.predptr[node + 1]].tolist()
+
+    def neighbors(self, node):
+        # as networkx.DiGraph, the neighbors are the successors
+        return self.successors(node)
+
+    def out_degree(self, node):
+        return int(self.succptr[node + 1] - self.succptr[node])
+
+    def in_degree(self, node):
+        return int(self.predptr[node + 1] - self.predptr[node])
+
+    def degree(self, node):
+        # a self loop counts twice, as in networkx
+        return self.out_degree(node) + self.in_degree(node)
+
+    def outdegrees(self):
+        return np.diff(self.succptr)
+
+    def indegrees(self):
+        return np.diff(self.predptr)
+
+    def degrees(self):
+        return self.outdegrees() + self.indegrees()
+
+    def attribute(self, name):
+        """Return {node: value} of one node attribute, like networkx.get_node_attributes."""
+        if name not in self.attrs:
+            return {}
+        return dict(enumerate(np.asarray(self.attrs[name]).tolist()))
+
+    def tolists(self):
+        """Return mutable successor and predecessor dicts per node, used as ordered sets."""
+        succ, succptr = self.succ.tolist(), self.succptr.tolist()
+        pred, predptr = self.pred.tolist(), self.predptr.tolist()
+        succs = [dict.fromkeys(succ[succptr[i]:succptr[i + 1]]) for i in range(len(self))]
+        preds = [dict.fromkeys(pred[predptr[i]:predptr[i + 1]]) for i in range(len(self))]
+        return succs, preds
+
+    def compact(self, order, succs, preds):
+        """Build the graph of the nodes in order, renumbered by their position, from mutable
+        adjacency dicts over the ids of this graph. Neighbours that are not in order are dropped."""
+        ids = {node: i for i, node in enumerate(order)}
+        newsuccs = [[ids[j] for j in succs[node] if j in ids] for node in order]
+        newpreds = [[ids[j] for j in preds[node] if j in ids] for node in order]
+        index = np.array(order, dtype=np.int64)
+        attrs = {name: np.asarray(values)[index] if len(index) else np.asarray(values)[:0]
+                 for name, values in self.attrs.items()}
+        return CfgGraph.fromlists(newsuccs, newpreds, attrs)
+
+    def removenodes(self, nodes):
+        """Contract a set of nodes in one pass, linking the predecessors of every removed node to its
+        successors through the removed subgraph, as repeated generategraph.removenode calls do.
+
+        Nodes are contracted in the given order, bypass edges to nodes removed later carry the
+        reachability on. Edges are deduplicated as they are made and removed nodes are only dropped
+        from the adjacency of their neighbours when the graph is compacted, so the successor and
+        predecessor order is the one of the sequential removal.
+        """
+        succs, preds = self.tolists()
+        alive = bytearray(b"\x01") * len(self)
+        for node in nodes:
+            if not alive[node]:
+                continue
+            alive[node] = 0
+            ins = [i for i in preds[node] if alive[i]]
+            if not ins:
+                continue
+            outs = [j for j in succs[node] if alive[j]]
+            for i in ins:
+                targets = succs[i]
+                for j in outs:
+                    if j != i and j not in targets:
+                        targets[j] = None
+                        preds[j][i] = None
+        return self.compact([i for i in range(len(self)) if alive[i]], succs, preds)
+
+    def mergechains(self):
+        """Collapse single entry single exit chains reachable from node 0, as generategraph.merge_nodes.
+
+        merge_nodes recurses once per node, this walks the same calls in the same order from an
+        explicit stack: deep(pre, now) has no work after its recursive calls, so pushing the
+        successors in reverse visits them exactly as the loop over them would. O(V + E).
+        """
+        if not len(self):
+            raise IndexError("list index out of range")
+        succ = self.succ.tolist()
+        succptr = self.succptr.tolist()
+        indegrees = self.indegrees().tolist()
+        outdegrees = self.outdegrees().tolist()
+        visited = bytearray(len(self))
+        order = {}
+        succs = {}
+        preds = {}
+
+        def addnode(node):
+            if node is None:
+                # a chain that leads back to node 0, networkx refuses the edge the same way
+                raise ValueError("None cannot be a node")
+            if node not in order:
+                order[node] = None
+                succs[node] = {}
+                preds[node] = {}
+
+        def addedge(pre, now):
+            addnode(pre)
+            addnode(now)
+            if now not in succs[pre]:
+                succs[pre][now] = None
+                preds[now][pre] = None
+
+        stack = [(None, 0)]
+        while stack:
+            pre, now = stack.pop()
+            while True:
+                if visited[now]:
+                    addedge(pre, now)
+                    break
+                visited[now] = 1
+                first = succptr[now]
+                if indegrees[now] == 1 and outdegrees[now] == 1 and indegrees[succ[first]] == 1:
+                    # inner node of a chain, pre is linked to whatever the chain leads to
+                    now = succ[first]
+                    continue
+                if pre is None:
+                    addnode(now)
+                else:
+                    addedge(pre, now)
+                for i in reversed(succ[first:succptr[now + 1]]):
+                    stack.append((now, i))
+                break
+        return self.compact(list(order), succs, preds)
+
+    def withselfloops(self):
+        """Return the graph with a self loop on every node, as Estimator._ensure_integrity adds them."""
+        succs, preds = self.tolists()
+        for i in range(len(self)):
+            if i not in succs[i]:
+                succs[i][i] = None
+                preds[i][i] = None
+        return CfgGraph.fromlists(succs, preds, self.attrs)
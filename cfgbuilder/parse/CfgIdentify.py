@@ -2,6 +2,7 @@ from parse.Cfg import Cfg
 from parse.BlockType import BlockType
 from parse.BasicBlock import BasicBlock
 from parse.entity import OrderDict,Triplet,Stack,Logger
+from parse.opcodes import IS_PUSH,IS_DUP,EQ,JUMPI
 import re
 BLOCK_LENGTH = 100
 # 对cfg中的所有内容进行识别
@@ -74,17 +75,18 @@ class CfgIdentify:
 
 
     def isDispatcher(self,block:BasicBlock):
-        if block.getInstruction(-5).group == "Duplication Operations" and \
-                    block.getInstruction(-4).group == "Push Operations" and \
-                    block.getInstruction(-3).name == "EQ" and \
-                    block.getInstruction(-2).group == "Push Operations" and\
-                    block.getInstruction(-1).name == "JUMPI":
+        ops = block.opcodes
+        if IS_DUP[ops[-5]] and \
+                    IS_PUSH[ops[-4]] and \
+                    ops[-3] == EQ and \
+                    IS_PUSH[ops[-2]] and\
+                    ops[-1] == JUMPI:
             return True
-        elif block.getInstruction(-5).group == "Push Operations" and \
-                    block.getInstruction(-4).group == "Duplication Operations" and \
-                    block.getInstruction(-3).name == "EQ" and \
-                    block.getInstruction(-2).group == "Push Operations" and\
-                    block.getInstruction(-1).name == "JUMPI":
+        elif IS_PUSH[ops[-5]] and \
+                    IS_DUP[ops[-4]] and \
+                    ops[-3] == EQ and \
+                    IS_PUSH[ops[-2]] and\
+                    ops[-1] == JUMPI:
             return True
         return False
         
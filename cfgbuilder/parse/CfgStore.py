@@ -0,0 +1,232 @@
+from parse.opcodes import NAMES, OPCODES
+import numpy as np
+import os, json
+
+# Columnar binary store for cfgs in the Cfg.storejson() layout.
+# Every column is a flat little-endian file that is appended per contract and
+# memory-mapped on read, so one contract loads without parsing the corpus:
+#   block_*   one entry per basic block, edges as CSR (succ_ptr/succ_target, pred_ptr/pred_offset)
+#   inst_*    one entry per instruction, operands wider than int64 go to big_*
+# index.jsonl holds one line per contract with its row offsets and metadata.
+# Opcodes are stored as bytes and named through the shared table of parse/opcodes.py.
+
+COLUMNS = {
+    "block_offset": "<i8",
+    "block_type": "u1",
+    "block_flags": "u1",
+    "block_stackbalance": "<i4",
+    "block_inst_ptr": "<i8",
+    "succ_ptr": "<i8",
+    "succ_target": "<i4",
+    "pred_ptr": "<i8",
+    "pred_offset": "<i8",
+    "inst_opcode": "u1",
+    "inst_pc": "<u4",
+    "inst_operand": "<i8",
+    "big_index": "<i8",
+    "big_value": "u1",
+}
+
+# values of BlockType
+BLOCKTYPES = ["UNDEFINED", "COMMON", "DISPATCHER", "FALLBACK", "START", "LOADER", "STOP"]
+
+RETAIN = 1
+HASCALLER = 2
+
+NO_OPERAND = -1
+BIG_OPERAND = -2
+BIG_SIZE = 32
+
+
+class CfgStoreWriter:
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in COLUMNS}
+        self._index = open(os.path.join(path, "index.jsonl"), "w")
+        self._blocks = 0
+        self._insts = 0
+        self._succs = 0
+        self._preds = 0
+
+    def _write(self, name, values):
+        np.asarray(values, dtype=COLUMNS[name]).tofile(self._files[name])
+
+    def add(self, blockdict, address=None):
+        """Append one cfg given as a Cfg.storejson() dict."""
+        blocks = blockdict["basicblocks"]
+        local = {block["offset"]: i for i, block in enumerate(blocks)}
+        instptr, succptr, targets, predptr, sources = [], [], [], [], []
+        opcodes, pcs, operands = [], [], []
+        bigindex, bigvalue = [], []
+        for block in blocks:
+            instptr.append(self._insts + len(opcodes))
+            succptr.append(self._succs + len(targets))
+            targets.extend(local[s] for s in block["successors"] if s in local)
+            predptr.append(self._preds + len(sources))
+            # predecessors may name blocks that were removed later, so they are kept as offsets
+            sources.extend(block["predecessors"])
+            for ins in block["instructions"]:
+                operand = ins["operand"]
+                if operand is None:
+                    operand = NO_OPERAND
+                elif operand > 0x7fffffffffffffff:
+                    bigindex.append(self._insts + len(opcodes))
+                    bigvalue.append(operand.to_bytes(BIG_SIZE, "big"))
+                    operand = BIG_OPERAND
+                opcodes.append(OPCODES[ins["opname"]])
+                pcs.append(ins["pc"])
+                operands.append(operand)
+
+        self._write("block_offset", [block["offset"] for block in blocks])
+        self._write("block_type", [BLOCKTYPES.index(block["blocktype"]) + 1 for block in blocks])
+        self._write("block_flags", [(RETAIN if block.get("retain", True) else 0) |
+                                    (HASCALLER if block.get("hascaller") else 0) for block in blocks])
+        self._write("block_stackbalance", [block["stackbalance"] for block in blocks])
+        self._write("block_inst_ptr", instptr)
+        self._write("succ_ptr", succptr)
+        self._write("succ_target", targets)
+        self._write("pred_ptr", predptr)
+        self._write("pred_offset", sources)
+        self._write("inst_opcode", opcodes)
+        self._write("inst_pc", pcs)
+        self._write("inst_operand", operands)
+        self._write("big_index", bigindex)
+        self._files["big_value"].write(b"".join(bigvalue))
+
+        record = {"address": address if address is not None else blockdict["contractname"],
+                  "contractname": blockdict["contractname"],
+                  "block": self._blocks,
+                  "blocks": len(blocks),
+                  "dispatchers": blockdict["dispatchers"],
+                  "fallbacks": blockdict["fallbacks"],
+                  "functions": blockdict["functions"],
+                  "loaders": blockdict["loaders"],
+                  "short": blockdict["short"]}
+        self._index.write(json.dumps(record) + "\n")
+        self._blocks += len(blocks)
+        self._insts += len(opcodes)
+        self._succs += len(targets)
+        self._preds += len(sources)
+
+    def close(self):
+        # closing entries of the CSR pointer columns
+        self._write("block_inst_ptr", [self._insts])
+        self._write("succ_ptr", [self._succs])
+        self._write("pred_ptr", [self._preds])
+        for fp in self._files.values():
+            fp.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CfgStoreReader:
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        with open(os.path.join(path, "index.jsonl")) as fp:
+            for line in fp:
+                record = json.loads(line)
+                self._records[record["address"]] = record
+        self._columns = {}
+        for name, dtype in COLUMNS.items():
+            filename = os.path.join(path, name + ".bin")
+            if os.path.getsize(filename):
+                self._columns[name] = np.memmap(filename, dtype=dtype, mode="r")
+            else:
+                self._columns[name] = np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, address):
+        return address in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    @property
+    def addresses(self):
+        return list(self._records)
+
+    def arrays(self, address):
+        """Return the columns of one cfg as array views, indices local to the cfg."""
+        record = self._records[address]
+        col = self._columns
+        b0 = record["block"]
+        b1 = b0 + record["blocks"]
+        instptr = np.asarray(col["block_inst_ptr"][b0:b1 + 1])
+        succptr = np.asarray(col["succ_ptr"][b0:b1 + 1])
+        predptr = np.asarray(col["pred_ptr"][b0:b1 + 1])
+        i0, i1 = int(instptr[0]), int(instptr[-1])
+        s0, s1 = int(succptr[0]), int(succptr[-1])
+        p0, p1 = int(predptr[0]), int(predptr[-1])
+        big = {}
+        lo, hi = np.searchsorted(col["big_index"], [i0, i1])
+        for k in range(lo, hi):
+            value = col["big_value"][k * BIG_SIZE:(k + 1) * BIG_SIZE]
+            big[int(col["big_index"][k]) - i0] = int.from_bytes(bytes(value), "big")
+        return {"record": record,
+                "offset": col["block_offset"][b0:b1],
+                "type": col["block_type"][b0:b1],
+                "flags": col["block_flags"][b0:b1],
+                "stackbalance": col["block_stackbalance"][b0:b1],
+                "inst_ptr": instptr - i0,
+                "succ_ptr": succptr - s0,
+                "succ_target": col["succ_target"][s0:s1],
+                "pred_ptr": predptr - p0,
+                "pred_offset": col["pred_offset"][p0:p1],
+                "opcode": col["inst_opcode"][i0:i1],
+                "pc": col["inst_pc"][i0:i1],
+                "operand": col["inst_operand"][i0:i1],
+                "big": big}
+
+    @staticmethod
+    def operand(arrays, i):
+        operand = int(arrays["operand"][i])
+        if operand == NO_OPERAND:
+            return None
+        if operand == BIG_OPERAND:
+            return arrays["big"][i]
+        return operand
+
+    def blockjson(self, address):
+        """Return one cfg in the Cfg.storejson() dict layout."""
+        arrays = self.arrays(address)
+        record = arrays["record"]
+        offsets = arrays["offset"].tolist()
+        instptr = arrays["inst_ptr"].tolist()
+        succptr = arrays["succ_ptr"].tolist()
+        targets = arrays["succ_target"].tolist()
+        opcodes = arrays["opcode"].tolist()
+        pcs = arrays["pc"].tolist()
+        predptr = arrays["pred_ptr"].tolist()
+        sources = arrays["pred_offset"].tolist()
+        blocks = []
+        for b, offset in enumerate(offsets):
+            flags = int(arrays["flags"][b])
+            instructions = [{"pc": pcs[i], "opname": NAMES[opcodes[i]],
+                             "operand": self.operand(arrays, i)}
+                            for i in range(instptr[b], instptr[b + 1])]
+            blocks.append({"offset": offset,
+                           "instructions": instructions,
+                           "predecessors": sources[predptr[b]:predptr[b + 1]],
+                           "successors": [offsets[t] for t in targets[succptr[b]:succptr[b + 1]]],
+                           "stackbalance": int(arrays["stackbalance"][b]),
+                           "blocktype": BLOCKTYPES[int(arrays["type"][b]) - 1],
+                           "hascaller": bool(flags & HASCALLER),
+                           "retain": bool(flags & RETAIN)})
+        return {"contractname": record["contractname"],
+                "basicblocks": blocks,
+                "dispatchers": record["dispatchers"],
+                "fallbacks": record["fallbacks"],
+                "functions": record["functions"],
+                "loaders": record["loaders"],
+                "short": record["short"]}
@@ -1,12 +1,26 @@
 from pyevmasm.evmasm import Instruction
+from parse.opcodes import POPS, PUSHES, IS_PUSH, IS_DUP, IS_SWAP, POP, AND
+
+class StackFrame:
+    """Immutable stack cell; copies of a SymbolicStack share their frames."""
+
+    __slots__ = ['value','below','depth','fingerprint']
+
+    def __init__(self,value,below):
+        self.value = value
+        self.below = below
+        self.depth = below.depth + 1 if below is not None else 1
+        self.fingerprint = None
 
 class SymbolicStack:
     MAX_STACK_SIZE:int = 1024
     STACK_TAIL_SIZE:int = 48
     STACK_TAIL_THRESHOLD:int = 200
 
+    __slots__ = ['_top']
+
     def __init__(self):
-        self._stack = []
+        self._top = None
 
     def execuate(self,op:Instruction ):
         if self.length > self.MAX_STACK_SIZE:
@@ -23,31 +37,66 @@ class SymbolicStack:
             self.execuateAnd(op)
         else:
             if self.length <= op.pops:
-                self._stack.clear()
+                self._top = None
             else:
                 for i in range(op.pops):
-                    self._stack.pop()
+                    self._top = self._top.below
             for i in range(op.pushes):
-                self._stack.append(None)
+                self.push(None)
+
+    def execuateOpcode(self,opcode,operand=None):
+        # same as execuate() for an instruction given as opcode byte and operand
+        if self.length > self.MAX_STACK_SIZE:
+            raise Exception("Exceeded")
+        if IS_PUSH[opcode]:
+            self.push(operand)
+        elif IS_DUP[opcode]:
+            self.dup(POPS[opcode])
+        elif IS_SWAP[opcode]:
+            self.swap(POPS[opcode])
+        elif opcode == POP:
+            self.execuatePop()
+        elif opcode == AND:
+            self.execuateAnd(None)
+        else:
+            pops = POPS[opcode]
+            if self.length <= pops:
+                self._top = None
+            else:
+                for i in range(pops):
+                    self._top = self._top.below
+            for i in range(PUSHES[opcode]):
+                self.push(None)
 
     def execuatePush(self,op:Instruction):
-        self._stack.append(op.operand)
+        self.push(op.operand)
 
     def execuateDup(self,op:Instruction):
-        index = self.length - op.pops
+        self.dup(op.pops)
+
+    def dup(self,pops):
+        index = self.length - pops
         if index >= 0:
-            x = self._stack[self.length - op.pops]
-            self._stack.append(x)
+            frame = self._top
+            for i in range(pops - 1):
+                frame = frame.below
+            self.push(frame.value)
         # else:
         #     self._stack.append(None)
 
     def execuateSwap(self,op:Instruction):
-        i = self.length - op.pops
+        self.swap(op.pops)
+
+    def swap(self,pops):
+        i = self.length - pops
         j = self.length - 1
         if i > 0 and j > 0:
-            tmp = self._stack[i]
-            self._stack[i] = self._stack[j]
-            self._stack[j] = tmp
+            values = []
+            for k in range(pops):
+                values.append(self.pop())
+            values[0], values[-1] = values[-1], values[0]
+            for value in reversed(values):
+                self.push(value)
         # else:
         #     self._stack.pop()
         #     self._stack.append(None)
@@ -60,24 +109,24 @@ class SymbolicStack:
         a = self.pop()
         b = self.pop()
         if a == None or b == None:
-            self._stack.append(None)
+            self.push(None)
         else:
-            self._stack.append(a&b)
+            self.push(a&b)
 
     def execuateAdd(self,op:Instruction):
         a = self.pop()
         b = self.pop()
         if a == None or b == None:
-            self._stack.append(None)
+            self.push(None)
         else:
-            self._stack.append(a+b)
+            self.push(a+b)
  
     def __repr__(self) -> str:
-        return repr(self._stack)
+        return repr(self.getStack())
 
     def __str__(self) -> str:
         list_str = "["
-        for i in self._stack:
+        for i in self.getStack():
             if i is not None:
                 list_str += "0x{:x},".format(i)
             else:
@@ -88,39 +137,83 @@ class SymbolicStack:
         return list_str
 
     def getStack(self):
-        return self._stack
+        values = []
+        frame = self._top
+        while frame is not None:
+            values.append(frame.value)
+            frame = frame.below
+        values.reverse()
+        return values
 
     @property
     def length(self):
-        return len(self._stack)
+        return self._top.depth if self._top is not None else 0
     
     def clear(self):
-        self._stack = []
+        self._top = None
 
     def copy(self):
         result = SymbolicStack()
-        result.getStack().extend(self._stack)
+        result._top = self._top
         return result
 
+    def push(self,value):
+        self._top = StackFrame(value,self._top)
+
     def peek(self):
-        if self.length:
-            return self._stack[-1]
+        if self._top is not None:
+            return self._top.value
 
     def pop(self):
-        if len(self._stack):
-            value = self._stack.pop()
+        if self._top is not None:
+            value = self._top.value
+            self._top = self._top.below
             return value
 
+    @classmethod
+    def tailsize(cls,length) -> int:
+        # deep stacks are compared on a shrinking tail
+        if length >= cls.STACK_TAIL_THRESHOLD + 100:
+            return int(cls.STACK_TAIL_SIZE / ((length - cls.STACK_TAIL_THRESHOLD) / 100))
+        return cls.STACK_TAIL_SIZE
+
+    def _window(self):
+        # stacks shorter than the tail are compared whole, longer ones on the top tailsize slots
+        length = self.length
+        size = self.tailsize(length)
+        return size, min(length, size)
+
+    def __hash__(self):
+        top = self._top
+        if top is None:
+            return hash(())
+        if top.fingerprint is None:
+            size, count = self._window()
+            values = []
+            frame = top
+            for i in range(count):
+                values.append(frame.value)
+                frame = frame.below
+            top.fingerprint = hash((size, count == size, tuple(values)))
+        return top.fingerprint
+
     def __eq__(self, other) -> bool:
         if isinstance(other,SymbolicStack):
             if id(self) == id(other): return True
             that:SymbolicStack = other
-            stackTailSize = self.STACK_TAIL_SIZE / ((self.length - self.STACK_TAIL_THRESHOLD) / 100)  if self.length >= self.STACK_TAIL_THRESHOLD + 100 else self.STACK_TAIL_SIZE
-            stackTailSize = int(stackTailSize)
-            if self.length < stackTailSize and that.length < stackTailSize:
-                return self._stack == that.getStack()
-            else:
-                return self._stack[self.length - stackTailSize:self.length] == that.getStack()[that.length-stackTailSize:that.length]
+            size, count = self._window()
+            if (size, count) != that._window():
+                return False
+            a = self._top
+            b = that._top
+            for i in range(count):
+                if a is b:
+                    return True
+                if a.value != b.value:
+                    return False
+                a = a.below
+                b = b.below
+            return True
 
         return False
 
@@ -0,0 +1,82 @@
+from parse.opcodes import SIZES, IS_TERMINATOR, IS_PUSH, JUMPDEST
+from array import array
+import re
+
+# Table driven bytecode decoder, the fast path of CfgBuilder.disassemble + generateBasicBlocks.
+# Block boundaries are found by one regular expression over the raw bytes, built from the opcode
+# table: a block is an optional JUMPDEST, any run of other instructions (PUSHn with its n immediate
+# bytes) and an optional terminator. Instructions are only walked inside each block to fill the
+# opcode arrays, operands are sliced out of the buffer for PUSH instructions only.
+# Like pyevmasm.disassemble_all, decoding stops at a PUSH whose immediate is cut off by the end.
+
+
+def _byteclass(ops):
+    return b"[" + b"".join(re.escape(bytes([op])) for op in ops) + b"]"
+
+
+def _instruction(ops):
+    # single byte instructions as one class, PUSHn as opcode followed by n bytes
+    single = [op for op in ops if SIZES[op] == 1]
+    parts = [_byteclass(single)] if single else []
+    for op in ops:
+        if SIZES[op] > 1:
+            parts.append(re.escape(bytes([op])) + b".{%d}" % (SIZES[op] - 1))
+    return b"(?:" + b"|".join(parts) + b")"
+
+
+_terminators = [op for op in range(256) if IS_TERMINATOR[op]]
+_others = [op for op in range(256) if not IS_TERMINATOR[op] and op != JUMPDEST]
+
+PUSHBYTE = re.compile(_byteclass([op for op in range(256) if IS_PUSH[op]]))
+BLOCK = re.compile(re.escape(bytes([JUMPDEST])) + b"?" + b"(?>" + _instruction(_others) + b"*)" +
+                   _byteclass(_terminators) + b"?", re.DOTALL)
+
+
+def tobytes(bytecode):
+    # same input handling as CfgBuilder.disassemble
+    if isinstance(bytecode, str):
+        bytecode = bytecode.replace('\n', '')
+        if bytecode.startswith('0x'):
+            bytecode = bytecode[2:]
+        return bytes.fromhex(bytecode)
+    # bytes and memoryview slices of BytecodeCleaner are used as they are, without a copy
+    return bytecode
+
+
+def decodeblock(code, start, end):
+    """Return (opcodes, pcs, operands) of the instructions in code[start:end]."""
+    if not PUSHBYTE.search(code, start, end):
+        # no PUSH, every byte is one instruction
+        return array('B', code[start:end]), array('I', range(start, end)), {}
+    opcodes = array('B')
+    pcs = array('I')
+    operands = {}
+    pc = start
+    while pc < end:
+        op = code[pc]
+        size = SIZES[op]
+        if size > 1:
+            operands[len(opcodes)] = int.from_bytes(code[pc + 1:pc + size], 'big')
+        opcodes.append(op)
+        pcs.append(pc)
+        pc += size
+    return opcodes, pcs, operands
+
+
+def blocks(code):
+    """Yield (offset, opcodes, pcs, operands) for every basic block of code, as
+    CfgBuilder.generateBasicBlocks splits the pyevmasm instructions."""
+    code = tobytes(code)
+    for match in BLOCK.finditer(code):
+        start, end = match.span()
+        if start == end:
+            # only a truncated PUSH is left
+            return
+        yield (start,) + decodeblock(code, start, end)
+
+
+def decode(code):
+    """Yield (opcode, pc, operand) for every instruction, the same sequence as pyevmasm.disassemble_all."""
+    for offset, opcodes, pcs, operands in blocks(code):
+        for i, op in enumerate(opcodes):
+            yield op, pcs[i], operands.get(i)
@@ -1,4 +1,5 @@
 import re,logging
+from bisect import bisect_left
 path = "C:/Users/Administrator/Desktop/黄琮雄-科研资资料/cfgbuilder/logs/"
 class Logger:
     
@@ -55,6 +56,8 @@ class Logger:
 
 class Pair:
 
+    __slots__ = ['_key','_value']
+
     def __init__(self,key,value):
         self._key = key
         self._value = value
@@ -81,68 +84,100 @@ class Pair:
         yield self._value
 
 class OrderDict:
+    """Insertion-ordered map from block offset to value.
+
+    Pairs are indexed by key in a dict, so get/update/remove are O(1).
+    The insertion-ordered pair list and a sorted key list are maintained
+    lazily, for positional access and offset range queries.
+    """
+
+    __slots__ = ['_index', '_sorted', '_order']
 
     def __init__(self):
-        self.orderSet = []
-    
+        self._index = {}
+        self._sorted = []
+        self._order = []
+
+    @property
+    def orderSet(self):
+        # shared with the map, read only
+        if self._order is None:
+            self._order = list(self._index.values())
+        return self._order
 
     @property
     def length(self):
-        return len(self.orderSet)
+        return len(self._index)
 
     @property
     def start(self) -> Pair:
-        if self.length > 0:
-            return self.orderSet[0]
+        if self._index:
+            return next(iter(self._index.values()))
     
     @property
     def end(self) -> Pair:
-        if self.length > 0:
-            return self.orderSet[-1]
+        if self._index:
+            return next(reversed(self._index.values()))
 
     def update(self,key,value):
-        for i in range(self.length):
-            if self.orderSet[i].key == key:
-                self.orderSet[i].setValue(value)
-                return
-        self.orderSet.append(Pair(key, value))
+        pair = self._index.get(key)
+        if pair is not None:
+            pair.setValue(value)
+            return
+        pair = self._index[key] = Pair(key, value)
+        if self._order is not None:
+            self._order.append(pair)
+        # blocks are mostly added in ascending offset order
+        if self._sorted is not None:
+            if not self._sorted or key > self._sorted[-1]:
+                self._sorted.append(key)
+            else:
+                self._sorted = None
 
     def remove(self,key):
-        for i in range(self.length):
-            if self.orderSet[i].key == key:
-                del self.orderSet[i]
-                return
+        if self._index.pop(key, None) is not None:
+            self._sorted = None
+            self._order = None
 
     def get(self,key):
-        for tp in self.orderSet:
-            if tp.key == key:
-                return tp.value
+        pair = self._index.get(key)
+        if pair is not None:
+            return pair.value
     
     def getbyindex(self,index):
         if index < self.length and index > self.length * -1:
             return self.orderSet[index]
 
     def keys(self):
-        for tp in self.orderSet:
-            yield tp.key
+        return self._index.keys()
+
+    def sortedkeys(self):
+        if self._sorted is None:
+            self._sorted = sorted(self._index)
+        return self._sorted
+
+    def between(self,low=None,high=None):
+        """Yield pairs with low <= key < high in ascending key order."""
+        keys = self.sortedkeys()
+        lo = 0 if low is None else bisect_left(keys, low)
+        hi = len(keys) if high is None else bisect_left(keys, high)
+        for key in keys[lo:hi]:
+            yield self._index[key]
 
     def __setitem__(self, key, value):
-        for i in range(self.length):
-            if self.orderSet[i].key == key:
-                self.orderSet[i].setValue(value)
-                return
-        self.orderSet.append(Pair(key, value))
+        self.update(key, value)
     
     def __getitem__(self, key):
-        for tp in self.orderSet:
-            if tp.key == key:
-                return tp.value
+        return self.get(key)
     
     def __delitem__(self, key):
-        for i in range(len(self.orderSet)):
-            if self.orderSet[i].key == key:
-                del self.orderSet[i]
-                return
+        self.remove(key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
     
     def __repr__(self):
         return repr(self.orderSet)
@@ -151,12 +186,13 @@ class OrderDict:
         return str(self.orderSet)
     
     def __iter__(self):
-        for tp in self.orderSet:
-            yield tp
+        # over the live dict, adding or removing a key while iterating raises RuntimeError,
+        # iterate over a list(...) of the map to mutate it
+        return iter(self._index.values())
 
 class Triplet:
 
-    __slot__ = ['_elem1','_elem2','_elem3']
+    __slots__ = ['_elem1','_elem2','_elem3']
 
     def __init__(self,e1,e2,e3):
         self._elem1 = e1
@@ -182,7 +218,7 @@ class Triplet:
         return "<{},{},{}>".format(self._elem1,self._elem2,self._elem3)
 
     def __hash__(self):
-        return hash(str(self.elem1)+str(self.elem2)+str(self.elem3))
+        return hash((self._elem1,self._elem2,self._elem3))
 
     def __eq__(self,other)->bool:
         if isinstance(other,Triplet):
@@ -247,7 +283,7 @@ class StringCleaner:
     state = re.compile(r'^(73[0-9a-fA-F]{40}3014)?60(60|80)604052[0-9a-fA-F]*$')
     deploy = re.compile(r'(0396000f3|0396000f300|0396000f3fe)(?=60(60|80)604052)')
     auxdata1 = re.compile(r'a165627a7a72305820[0-9a-f]{64}0029')
-    auxdata2 = re.compile(r'a265627a7a72(30|31)5820[0-9a-f]{64}64736f6c6343[0-9a-f]{6}0032"')
+    auxdata2 = re.compile(r'a265627a7a72(30|31)5820[0-9a-f]{64}64736f6c6343[0-9a-f]{6}0032')
     auxdata3 = re.compile(r'a264697066735822[0-9a-f]{68}64736f6c6343[0-9a-f]{6}00(32|33)')
     def __init__(self):
         pass
@@ -287,4 +323,81 @@ class StringCleaner:
     @staticmethod
     def removeInfo(source):
         temp = StringCleaner.removedeploy(source)
-        return StringCleaner.removeauxdata(temp)
\ No newline at end of file
+        return StringCleaner.removeauxdata(temp)
+
+
+class BytecodeCleaner:
+    """StringCleaner.removeInfo on the decoded bytes, returning a memoryview slice of them.
+
+    The constructor/runtime boundary is CODECOPY PUSH1 0 RETURN, optionally followed by STOP or
+    INVALID, in front of the runtime's 60 60|80 60 40 52 prologue. Metadata candidates are found by
+    their CBOR map prefix and checked up to the two byte length suffix that closes the trailer.
+    As in StringCleaner the first match wins, bzzr0 before bzzr1 before ipfs, and everything from
+    it on is dropped. Matches are byte aligned, the hex regexes could also hit between nibbles.
+    """
+
+    DEPLOY = b"\x39\x60\x00\xf3"
+    DEPLOY_SUFFIXES = (b"", b"\x00", b"\xfe")
+    RUNTIME = (b"\x60\x60\x60\x40\x52", b"\x60\x80\x60\x40\x52")
+    SOLC = b"\x64solc\x43"
+    # (map prefixes, hash bytes, solc version bytes, length suffixes)
+    AUXDATA = [((b"\xa1\x65bzzr0\x58\x20",), 32, None, (b"\x00\x29",)),
+               ((b"\xa2\x65bzzr0\x58\x20", b"\xa2\x65bzzr1\x58\x20"), 32, 3, (b"\x00\x32",)),
+               ((b"\xa2\x64ipfs\x58\x22",), 34, 3, (b"\x00\x32", b"\x00\x33"))]
+
+    @staticmethod
+    def tobytes(source):
+        if isinstance(source, str):
+            source = source.replace('\n', '')
+            if source.startswith('0x'):
+                source = source[2:]
+            return bytes.fromhex(source)
+        return bytes(source)
+
+    @staticmethod
+    def findruntime(code):
+        # offset of the runtime prologue behind the first deploy sequence, None without one
+        pos = code.find(BytecodeCleaner.DEPLOY)
+        while pos != -1:
+            # the hex pattern starts with the low nibble 0 of the byte before CODECOPY
+            if pos > 0 and code[pos - 1] & 0x0f == 0:
+                end = pos + len(BytecodeCleaner.DEPLOY)
+                for suffix in BytecodeCleaner.DEPLOY_SUFFIXES:
+                    start = end + len(suffix)
+                    if code.startswith(suffix, end) and code.startswith(BytecodeCleaner.RUNTIME, start):
+                        return start
+            pos = code.find(BytecodeCleaner.DEPLOY, pos + 1)
+        return None
+
+    @staticmethod
+    def findauxdata(code, start=0):
+        # offset of the first metadata trailer in code[start:], None without one
+        for prefixes, hashsize, versionsize, suffixes in BytecodeCleaner.AUXDATA:
+            found = None
+            for prefix in prefixes:
+                pos = code.find(prefix, start)
+                while pos != -1 and (found is None or pos < found):
+                    end = pos + len(prefix) + hashsize
+                    if versionsize is not None:
+                        if not code.startswith(BytecodeCleaner.SOLC, end):
+                            pos = code.find(prefix, pos + 1)
+                            continue
+                        end += len(BytecodeCleaner.SOLC) + versionsize
+                    if code[end:end + 2] in suffixes:
+                        found = pos
+                        break
+                    pos = code.find(prefix, pos + 1)
+            if found is not None:
+                return found
+        return None
+
+    @staticmethod
+    def removeInfo(source):
+        code = BytecodeCleaner.tobytes(source)
+        start = BytecodeCleaner.findruntime(code)
+        if start is None:
+            start = 0
+        end = BytecodeCleaner.findauxdata(code, start)
+        if end is None:
+            end = len(code)
+        return memoryview(code)[start:end]
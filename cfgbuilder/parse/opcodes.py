@@ -0,0 +1,96 @@
+from pyevmasm.evmasm import instruction_tables, DEFAULT_FORK, Instruction
+
+# Opcode property table of the default fork, indexed by the opcode byte.
+# Bytes without an instruction behave like pyevmasm's INVALID: no operand, no stack effect, terminator.
+# Blocks keep instructions as integer opcodes and look everything else up here.
+# This module only depends on pyevmasm so it can be shared outside cfgbuilder.
+
+_table = instruction_tables[DEFAULT_FORK]
+
+
+def _instruction(op):
+    if op in _table.keys():
+        return _table[op]
+    return Instruction(op, "INVALID", 0, 0, 0, 0, "Unspecified invalid instruction.")
+
+
+_ins = [_instruction(op) for op in range(256)]
+
+NAMES = tuple(i.name for i in _ins)
+GROUPS = tuple(i.group for i in _ins)
+POPS = bytes(i.pops for i in _ins)
+PUSHES = bytes(i.pushes for i in _ins)
+OPERAND_SIZES = bytes(i.operand_size for i in _ins)
+SIZES = bytes(i.size for i in _ins)
+IS_TERMINATOR = bytes(i.is_terminator for i in _ins)
+IS_BRANCH = bytes(i.is_branch for i in _ins)
+IS_PUSH = bytes(i.group == "Push Operations" for i in _ins)
+IS_DUP = bytes(i.group == "Duplication Operations" for i in _ins)
+IS_SWAP = bytes(i.group == "Exchange Operations" for i in _ins)
+# same test as the former `"CALL" in name`, so CALLER, CALLVALUE and CALLDATA* count as well
+IS_CALL = bytes("CALL" in i.name for i in _ins)
+
+OPCODES = {NAMES[op]: op for op in range(256) if op in _table.keys()}
+OPCODES["INVALID"] = 0xfe
+
+STOP = 0x00
+AND = 0x16
+EQ = 0x14
+ISZERO = 0x15
+CALLVALUE = 0x34
+POP = 0x50
+JUMP = 0x56
+JUMPI = 0x57
+JUMPDEST = 0x5b
+
+
+class Op:
+    """Read-only view of one instruction of a block, with the Instruction attributes the code uses."""
+
+    __slots__ = ['opcode', 'pc', 'operand']
+
+    def __init__(self, opcode, pc, operand=None):
+        self.opcode = opcode
+        self.pc = pc
+        self.operand = operand
+
+    @property
+    def name(self):
+        return NAMES[self.opcode]
+
+    @property
+    def semantics(self):
+        return _ins[self.opcode].semantics
+
+    @property
+    def group(self):
+        return GROUPS[self.opcode]
+
+    @property
+    def pops(self):
+        return POPS[self.opcode]
+
+    @property
+    def pushes(self):
+        return PUSHES[self.opcode]
+
+    @property
+    def size(self):
+        return SIZES[self.opcode]
+
+    @property
+    def is_terminator(self):
+        return bool(IS_TERMINATOR[self.opcode])
+
+    @property
+    def is_branch(self):
+        return bool(IS_BRANCH[self.opcode])
+
+    def __str__(self) -> str:
+        if self.operand is not None:
+            return "{} {}".format(self.name, hex(self.operand))
+        else:
+            return "{}".format(self.name)
+
+    def __repr__(self) -> str:
+        return "<{:x} {}>".format(self.pc, self)
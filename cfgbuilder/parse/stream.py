@@ -0,0 +1,71 @@
+import csv, sys
+
+# Streaming readers for the pipeline csv files, whose cells are large JSON blobs.
+# Rows are parsed one at a time with the csv module, so memory stays bounded by the
+# chunk being processed instead of the whole file.
+# This module only depends on the standard library so it can be shared outside cfgbuilder.
+
+CHUNKSIZE = 256
+
+
+def setfieldlimit():
+    # bytecode and cfg cells are far above the default 128KB field limit
+    limit = sys.maxsize
+    while True:
+        try:
+            csv.field_size_limit(limit)
+            return
+        except OverflowError:
+            limit //= 10
+
+
+setfieldlimit()
+
+
+def iterrecords(path, columns, index="address"):
+    """Yield (address, payload) for every row of a csv file.
+
+    columns is a column name, payload is then that cell, or a list of names, payload is
+    then a tuple of cells. Empty cells are None, as pandas would give NaN for them.
+    """
+    single = isinstance(columns, str)
+    names = [columns] if single else list(columns)
+    with open(path, newline="") as fp:
+        reader = csv.reader(fp)
+        header = next(reader, None)
+        if header is None:
+            return
+        key = header.index(index)
+        positions = [header.index(name) for name in names]
+        for row in reader:
+            if not row:
+                continue
+            values = tuple(row[p] if p < len(row) and row[p] != "" else None for p in positions)
+            yield row[key], values[0] if single else values
+
+
+def iterchunks(records, size=CHUNKSIZE):
+    """Group an iterable into lists of at most size items."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def countrecords(path):
+    # one streaming pass, only used for progress totals
+    with open(path, newline="") as fp:
+        reader = csv.reader(fp)
+        next(reader, None)
+        return sum(1 for row in reader if row)
+
+
+def findrecord(path, address, columns, index="address"):
+    for key, payload in iterrecords(path, columns, index):
+        if key == address:
+            return payload
+    raise KeyError(address)
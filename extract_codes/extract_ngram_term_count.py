@@ -1,4 +1,6 @@
 import pandas as pd
+import numpy as np
+import scipy.sparse as sp
 import os, json, math, csv
 
 listpath = "../dataset/lists/"
@@ -129,6 +131,130 @@ def extract_ngram_term_count(gramlist, cfglists, output):
                 print(fail)
 
 
+# n-gram codes pack opcode ids (1..255) in base 256, so an n-gram code lies in [256^(n-1), 256^n)
+# and the sorted code space is already grouped by n-gram order
+BASE = 256
+ORDERS = 4
+
+
+def ngramcodes(ids, blocks):
+    # ids: opcode id per instruction of a whole contract, blocks: block number per instruction
+    codes = []
+    totals = []
+    gram = ids
+    for n in range(ORDERS):
+        if n > 0:
+            gram = gram[:-1] * BASE + ids[n:]
+        valid = blocks[:max(len(blocks) - n, 0)] == blocks[n:]
+        codes.append(gram[valid])
+        totals.append(int(valid.sum()))
+    return np.concatenate(codes), totals
+
+
+def decodengram(code, names):
+    ops = []
+    while code:
+        ops.append(names[code % BASE - 1])
+        code //= BASE
+    return "_".join(reversed(ops))
+
+
+def extract_ngram_sparse(cfglists, output):
+    """Sparse n-gram term counts, one CSR row per contract.
+
+    Writes <output>.npz with the count matrix and <output>.json with the column
+    vocabulary in the storengramlist layout plus the row addresses. The columns are
+    1gram + 2gram + 3gram + 4gram + the four *_counts totals, as in extract_ngram_term_count.
+    """
+    path = listpath + cfglists
+    data = pd.read_csv(path, index_col="address")
+    success = 0
+    total = len(data.index)
+    fail = 0
+
+    opids = {}
+    addresses = []
+    rowcodes = []
+    rowcounts = []
+    rowtotals = []
+    for ind in data.index:
+        try:
+            lis = json.loads(data.loc[ind, "oplist"])
+            ids = []
+            blocks = []
+            for b, ins in enumerate(lis):
+                for i in ins:
+                    if i not in opids:
+                        opids[i] = len(opids) + 1
+                        if opids[i] >= BASE:
+                            raise ValueError("more than {} distinct opcodes".format(BASE - 1))
+                    ids.append(opids[i])
+                blocks.extend([b] * len(ins))
+            codes, totals = ngramcodes(np.array(ids, dtype=np.int64), np.array(blocks, dtype=np.int64))
+            codes, counts = np.unique(codes, return_counts=True)
+            addresses.append(ind)
+            rowcodes.append(codes)
+            rowcounts.append(counts)
+            rowtotals.append(totals)
+            success += 1
+        except Exception as e:
+            print(e)
+            fail += 1
+    print(success, " / ", total)
+    print(fail)
+
+    vocab = np.unique(np.concatenate(rowcodes)) if rowcodes else np.zeros(0, dtype=np.int64)
+    indptr = np.zeros(len(rowcodes) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(codes) + ORDERS for codes in rowcodes])
+    indices = np.empty(indptr[-1], dtype=np.int64)
+    values = np.empty(indptr[-1], dtype=np.int64)
+    for r, (codes, counts, totals) in enumerate(zip(rowcodes, rowcounts, rowtotals)):
+        lo, mid, hi = indptr[r], indptr[r] + len(codes), indptr[r + 1]
+        indices[lo:mid] = np.searchsorted(vocab, codes)
+        values[lo:mid] = counts
+        indices[mid:hi] = len(vocab) + np.arange(ORDERS)
+        values[mid:hi] = totals
+    matrix = sp.csr_matrix((values, indices, indptr), shape=(len(rowcodes), len(vocab) + ORDERS))
+    matrix.eliminate_zeros()
+
+    names = [None] * len(opids)
+    for name, i in opids.items():
+        names[i - 1] = name
+    oplist = {"{}gram".format(n + 1): [] for n in range(ORDERS)}
+    for code in vocab.tolist():
+        n = (code.bit_length() - 1) // 8
+        oplist["{}gram".format(n + 1)].append(decodengram(code, names))
+    oplist["addresses"] = addresses
+
+    sp.save_npz(midpath + output + ".npz", matrix)
+    with open(midpath + output + ".json", "w") as fp:
+        json.dump(oplist, fp)
+    return matrix, oplist
+
+
+def loadngramcounts(name):
+    matrix = sp.load_npz(midpath + name + ".npz").tocsr()
+    oplist = getngramlist(name + ".json")
+    return matrix, oplist
+
+
+def ngramcolumns(oplist):
+    return oplist["1gram"] + oplist["2gram"] + oplist["3gram"] + oplist["4gram"] + \
+           ["1gram_counts", "2gram_counts", "3gram_counts", "4gram_counts"]
+
+
+def sparse_to_csv(name, output):
+    # dense csv in the extract_ngram_term_count layout, for the downstream csv readers
+    matrix, oplist = loadngramcounts(name)
+    feature_cols = ngramcolumns(oplist)
+    with open(midpath + output, "w") as fp:
+        fieldnames = ['address'] + feature_cols
+        writer = csv.writer(fp)
+        writer.writerow(fieldnames)
+        for r, ind in enumerate(oplist["addresses"]):
+            writer.writerow([ind] + matrix[r].toarray()[0].tolist())
+
+
 def readcsv():
     path = midpath + "rawcfgs_ngram_count.csv"
     data = pd.read_csv(path, index_col="address")
@@ -137,7 +263,7 @@ def readcsv():
     print(j)
 
 
-if __name__ == "__main__":
+def extract_dense():
     storengramlist("rawcfglists.csv","rawcfg_ngram_term_count.json")
     storengramlist("removedcfglists.csv","removedcfg_ngram_term_count.json")
     storengramlist("filteredcfglists.csv","filteredcfg_ngram_term_count.json")
@@ -145,3 +271,9 @@ if __name__ == "__main__":
     extract_ngram_term_count("rawcfg_ngram_term_count.json","rawcfglists.csv","rawcfgs_ngram_count.csv")
     extract_ngram_term_count("removedcfg_ngram_term_count.json","removedcfglists.csv","removedcfgs_ngram_count.csv")
     extract_ngram_term_count("filteredcfg_ngram_term_count.json","filteredcfglists.csv","filteredcfgs_ngram_count.csv")
+
+
+if __name__ == "__main__":
+    extract_ngram_sparse("rawcfglists.csv", "rawcfgs_ngram_count")
+    extract_ngram_sparse("removedcfglists.csv", "removedcfgs_ngram_count")
+    extract_ngram_sparse("filteredcfglists.csv", "filteredcfgs_ngram_count")
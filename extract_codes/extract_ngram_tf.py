@@ -1,76 +1,76 @@
 import pandas as pd
+import numpy as np
+import scipy.sparse as sp
 import os,json,math,csv
+from extract_ngram_term_count import loadngramcounts, ORDERS
 
 listpath = "../dataset/lists/"
 midpath = "../dataset/features/mid_product/"
 featurepath = midpath
 TOTAL_NUM = 6166
 
-def extract_tf(tcfile,ngramfile,storefile):
+def ngramorders(cols):
+    # n-gram order (0..3) of every feature column, -1 for the *_counts columns
+    orders = []
+    for n in range(ORDERS):
+        orders.extend([n] * len(cols["{}gram".format(n + 1)]))
+    orders.extend([-1] * ORDERS)
+    return np.array(orders, dtype=np.int64)
+
+
+def term_frequency(counts, cols):
+    """Row-normalize a count matrix per n-gram order.
+
+    counts has the ngramcolumns() layout, the last ORDERS columns hold the totals of every
+    order and are kept as they are. Returns a float CSR matrix in the same layout.
+    """
+    counts = sp.csr_matrix(counts, dtype=np.float64)
+    counts.sort_indices()
+    orders = ngramorders(cols)
+    totals = counts[:, counts.shape[1] - ORDERS:].toarray()
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    order = orders[counts.indices]
+    gram = order >= 0
+    denom = totals[rows[gram], order[gram]]
+    data = counts.data.copy()
+    data[gram] = np.divide(data[gram], denom, out=np.zeros(len(denom)), where=denom != 0)
+    tf = sp.csr_matrix((data, counts.indices.copy(), counts.indptr.copy()), shape=counts.shape)
+    tf.eliminate_zeros()
+    return tf
+
+
+def write_csv(matrix, addresses, feature_cols, storefile):
+    with open(featurepath + storefile,"w")as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['address'] + feature_cols)
+        for r, ind in enumerate(addresses):
+            writer.writerow([ind] + matrix[r].toarray()[0].tolist())
 
+
+def extract_tf(tcfile,ngramfile,storefile):
+    # dense csv in, dense csv out, same layout as before
     data = pd.read_csv(midpath+tcfile, index_col="address")
     print("load data",tcfile)
     cols = getngramlist(ngramfile)
     feature_cols = cols["1gram"]+cols["2gram"]+cols["3gram"]+cols["4gram"] +\
      ["1gram_counts","2gram_counts","3gram_counts","4gram_counts"]
 
-    with open(featurepath + storefile,"w")as fp:
-        fieldnames = ['address'] + feature_cols
-        writer = csv.DictWriter(fp, fieldnames=fieldnames)
-        writer.writeheader()
-        success = 0
-        total = len(data.index)
-        fail = 0
-        faillist=[]
-
-        for ind in data.index:
-            try:
-                x = {"address":ind}
-                # 1gram
-                sum = data.loc[ind,"1gram_counts"]
-                for op in cols["1gram"]:
-                    c=data.loc[ind,op]
-                    if c == 0 or sum == 0:
-                        x[op] = 0.0
-                    else:
-                        x[op] = (c*1.0)/(sum*1.0)
-                x["1gram_counts"] = sum
-                # 2gram
-                sum = data.loc[ind,"2gram_counts"]
-                for op in cols["2gram"]:
-                    c=data.loc[ind,op]
-                    if c == 0 or sum == 0:
-                        x[op] = 0.0
-                    else:
-                        x[op] = (c*1.0)/(sum*1.0)
-                x["2gram_counts"]=sum
-                # 3gram
-                sum = data.loc[ind,"3gram_counts"]
-                for op in cols["3gram"]:
-                    c=data.loc[ind,op]
-                    if c == 0 or sum == 0:
-                        x[op] = 0.0
-                    else:
-                        x[op] = (c*1.0)/(sum*1.0)
-                x["3gram_counts"]=sum
-                # 4gram
-                sum = data.loc[ind,"4gram_counts"]
-                for op in cols["4gram"]:
-                    c=data.loc[ind,op]
-                    if c == 0 or sum == 0:
-                        x[op] = 0.0
-                    else:
-                        x[op] = (c*1.0)/(sum*1.0)
-                x["4gram_counts"]=sum
-
-                writer.writerow(x)
-                success +=1
-            except Exception as e:
-                fail+=1
-                faillist.append(ind)
-            finally:
-                print(success," / ",fail, " / ", total)
-        print(faillist)
+    counts = sp.csr_matrix(data[feature_cols].to_numpy(dtype=np.float64))
+    tf = term_frequency(counts, cols)
+    write_csv(tf, data.index, feature_cols, storefile)
+    print(tf.shape[0]," / ",len(data.index))
+
+
+def extract_tf_sparse(countname, output):
+    """TF of the extract_ngram_sparse output, written as <output>.npz and <output>.json."""
+    counts, cols = loadngramcounts(countname)
+    print("load data",countname)
+    tf = term_frequency(counts, cols)
+    sp.save_npz(midpath + output + ".npz", tf)
+    with open(midpath + output + ".json", "w") as fp:
+        json.dump(cols, fp)
+    print(tf.shape[0]," / ",counts.shape[0])
+    return tf, cols
 
 
 def getngramlist(name):
@@ -83,7 +83,6 @@ def getngramlist(name):
 
 
 if __name__ == "__main__":
-    extract_tf("rawcfgs_ngram_count.csv","rawcfg_ngram_term_count.json","rawcfg_ngram_tf.csv")
-    extract_tf("removedcfgs_ngram_count.csv","removedcfg_ngram_term_count.json","removedcfg_ngram_tf.csv")
-    extract_tf("filteredcfgs_ngram_count.csv","filteredcfg_ngram_term_count.json","filteredcfg_ngram_tf.csv")
-
+    extract_tf_sparse("rawcfgs_ngram_count","rawcfg_ngram_tf")
+    extract_tf_sparse("removedcfgs_ngram_count","removedcfg_ngram_tf")
+    extract_tf_sparse("filteredcfgs_ngram_count","filteredcfg_ngram_tf")
@@ -1,5 +1,7 @@
 import pandas as pd
-import os, json, math, csv
+import numpy as np
+import scipy.sparse as sp
+import os, json, csv
 
 listpath = "../dataset/lists/"
 midpath = "../dataset/features/mid_product/"
@@ -7,59 +9,117 @@ featurepath = midpath
 TOTAL_NUM = 6166
 
 
-def extract_tfidf(tffile, ngramfile, storefile):
+class NgramIdf:
+    """Smoothed idf of the n-gram columns, idf = log((N + 1) / (df + 1)) + 1.
+
+    fit() learns df from the column nnz of a tf matrix, transform() scales any tf matrix
+    by the learned idf. Columns are matched by name, so new contracts with their own
+    vocabulary can be transformed, n-grams unseen at fit time are dropped.
+    """
+
+    def __init__(self):
+        self.columns = []
+        self.idf = np.zeros(0)
+        self.total = 0
+
+    def fit(self, tf, columns, total=None):
+        tf = sp.csr_matrix(tf)[:, :len(columns)]
+        self.columns = list(columns)
+        self.total = tf.shape[0] if total is None else total
+        df = np.bincount(tf.indices[tf.data > 0], minlength=len(columns))
+        self.idf = np.log((self.total + 1.0) / (df + 1.0)) + 1.0
+        return self
+
+    def align(self, tf, columns):
+        # reorder the columns of tf to the fitted vocabulary
+        if list(columns[:len(self.columns)]) == self.columns:
+            return sp.csr_matrix(tf)[:, :len(self.columns)]
+        index = {col: i for i, col in enumerate(self.columns)}
+        tf = sp.coo_matrix(tf)
+        target = np.array([index.get(col, -1) for col in columns] +
+                          [-1] * (tf.shape[1] - len(columns)), dtype=np.int64)[tf.col]
+        keep = target >= 0
+        return sp.csr_matrix((tf.data[keep], (tf.row[keep], target[keep])),
+                             shape=(tf.shape[0], len(self.columns)))
+
+    def transform(self, tf, columns=None):
+        if columns is not None:
+            tf = self.align(tf, columns)
+        else:
+            tf = sp.csr_matrix(tf)[:, :len(self.columns)]
+        return sp.csr_matrix(tf.multiply(self.idf[np.newaxis, :]))
+
+    def fit_transform(self, tf, columns, total=None):
+        return self.fit(tf, columns, total).transform(tf)
+
+    def save(self, name):
+        with open(midpath + name, "w") as fp:
+            json.dump({"total": self.total, "columns": self.columns, "idf": self.idf.tolist()}, fp)
+
+    @classmethod
+    def load(cls, name):
+        with open(midpath + name) as fp:
+            j = json.load(fp)
+        model = cls()
+        model.total = j["total"]
+        model.columns = j["columns"]
+        model.idf = np.array(j["idf"])
+        return model
+
+
+def write_csv(matrix, addresses, feature_cols, storefile):
+    with open(featurepath + storefile, "w") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["address"] + [col + "_tfidf" for col in feature_cols])
+        for r, ind in enumerate(addresses):
+            writer.writerow([ind] + matrix[r].toarray()[0].tolist())
+
+
+def extract_tfidf(tffile, ngramfile, storefile, total=TOTAL_NUM):
+    # dense tf csv in, dense tfidf csv out, same layout as before
     data = pd.read_csv(featurepath + tffile, index_col="address")
     cols = getngramlist(ngramfile)
     feature_cols = cols["1gram"] + cols["2gram"] + cols["3gram"] + cols["4gram"]
 
-    ni = {}
-    try:
-        tot = len(feature_cols)
-        cc = 0
-        for col in feature_cols:
-            ni[col] = 0.0
-            for ind in data.index:
-                if data[col].get(ind) > 0.0:
-                    ni[col] += 1.0
-            cc += 1
-            print("ni", cc, "/", tot)
-        print("ni end")
-    except Exception as e:
-        print("ni error")
-
-    idf = {}
-    try:
-        tot = len(feature_cols)
-        cc = 0
-        for col in feature_cols:
-            idf[col] = math.log((TOTAL_NUM + 1.0) / (float(ni[col]) + 1.0)) + 1.0
-            cc += 1
-            print("idf:", cc, "/", tot)
-        print("idf end")
-    except Exception as e:
-        print("idf error")
-
-    tfidf = []
-    succ = 0
-    fail = 0
-    tot = TOTAL_NUM
-    for ind in data.index:
-        x = {"address": ind}
-        try:
-            for col in feature_cols:
-                newcol = col + "_tfidf"
-                x[newcol] = float(data[col].get(ind)) * idf[col]
-            tfidf.append(x)
-            succ += 1
-        except Exception as e:
-            print(e)
-            fail += 1
-        finally:
-            print("tfidf:", succ, fail, tot)
+    tf = sp.csr_matrix(data[feature_cols].to_numpy(dtype=np.float64))
+    model = NgramIdf()
+    tfidf = model.fit_transform(tf, feature_cols, total)
+    print("store start")
+    write_csv(tfidf, data.index, feature_cols, storefile)
+    print("store end")
+    return model
+
+
+def extract_tfidf_sparse(tfname, output, idffile=None, fit=True, total=TOTAL_NUM):
+    """TF-IDF of the extract_tf_sparse output.
+
+    Fits the idf on tfname and saves it to idffile when one is named. N of the idf is total,
+    the size of the whole dataset as in extract_tfidf, not the rows of tf, which only holds the
+    contracts whose cfg was built. With fit=False the idf saved in idffile is used instead, it
+    must have been fitted on this same tf (same total and columns); new contracts go through
+    NgramIdf.load(idffile).transform(tf, columns).
+    Writes <output>.npz and the dense <output>.csv.
+    """
+    tf = sp.load_npz(midpath + tfname + ".npz").tocsr()
+    cols = getngramlist(tfname + ".json")
+    feature_cols = cols["1gram"] + cols["2gram"] + cols["3gram"] + cols["4gram"]
+    if fit:
+        model = NgramIdf().fit(tf, feature_cols, total)
+        if idffile is not None:
+            model.save(idffile)
+    else:
+        if idffile is None:
+            raise ValueError("fit=False needs the idffile of a fitted idf")
+        model = NgramIdf.load(idffile)
+        if model.total != total or model.columns != feature_cols:
+            raise ValueError("{} was fitted on {} contracts and {} columns, {} has {} and {}".format(
+                idffile, model.total, len(model.columns), tfname, total, len(feature_cols)))
+    tfidf = model.transform(tf, feature_cols)
+    sp.save_npz(midpath + output + ".npz", tfidf)
     print("store start")
-    data = pd.DataFrame(tfidf)
-    data.to_csv(featurepath + storefile, index=False)
+    write_csv(tfidf, cols["addresses"], model.columns, output + ".csv")
     print("store end")
+    return tfidf, model
 
 
 def getngramlist(name):
@@ -70,6 +130,7 @@ def getngramlist(name):
 
 
 if __name__ == "__main__":
-    extract_tfidf("rawcfg_ngram_tf.csv", "rawcfg_ngram_term_count.json", "rawcfg_ngram_tfidf.csv")
-    extract_tfidf("removedcfg_ngram_tf.csv", "removedcfg_ngram_term_count.json", "removedcfg_ngram_tfidf.csv")
-    extract_tfidf("filteredcfg_ngram_tf.csv", "filteredcfg_ngram_term_count.json", "filteredcfg_ngram_tfidf.csv")
+    # the idf is refitted on the current corpus every run and saved for transforming new contracts
+    extract_tfidf_sparse("rawcfg_ngram_tf", "rawcfg_ngram_tfidf", "rawcfg_ngram_idf.json", fit=True)
+    extract_tfidf_sparse("removedcfg_ngram_tf", "removedcfg_ngram_tfidf", "removedcfg_ngram_idf.json", fit=True)
+    extract_tfidf_sparse("filteredcfg_ngram_tf", "filteredcfg_ngram_tfidf", "filteredcfg_ngram_idf.json", fit=True)
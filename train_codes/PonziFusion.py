@@ -2,11 +2,10 @@ import pandas as pd
 import numpy as np
 import warnings
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import StratifiedKFold, cross_val_score
-from sklearn.metrics import f1_score, accuracy_score, precision_score, recall_score, roc_auc_score
 from sklearn.preprocessing import MinMaxScaler
 from imblearn.over_sampling import SVMSMOTE
 from imblearn.pipeline import Pipeline as ImbPipeline
+from evaluation import cross_evaluate, report
 
 warnings.filterwarnings('ignore')
 
@@ -49,32 +48,15 @@ def run_evaluation(X, y):
 
     print(f"--- Evaluating PonziFusion (3-gram + CFG-4) ---")
 
-    metrics_results = {
-        'accuracy': [],
-        'precision': [],
-        'recall': [],
-        'f1': [],
-        'roc_auc': []
-    }
-
-    for seed in seeds:
-        rf_model.set_params(random_state=seed)
-        pipeline = ImbPipeline([
-            ('smote', SVMSMOTE(random_state=seed)),
-            ('model', rf_model)
-        ])
-
-        cv = StratifiedKFold(n_splits=10, shuffle=True, random_state=seed)
-
-        for metric in metrics_results.keys():
-            score = cross_val_score(pipeline, X, y, cv=cv, scoring=metric, n_jobs=-1).mean()
-            metrics_results[metric].append(score)
-
-    for metric, scores in metrics_results.items():
-        scores_arr = np.array(scores)
-        print(f"{metric.capitalize():<10}: {scores_arr.mean():.4f} (+/- {scores_arr.std():.4f})")
-        print(f"CV_Results_{metric}: {scores_arr.tolist()}")
-        print("-" * 40)
+    pipeline = ImbPipeline([
+        ('smote', SVMSMOTE()),
+        ('model', rf_model)
+    ])
+
+    # smote and forest get random_state=seed and the folds are shuffled by it, one fit per fold
+    records = cross_evaluate(pipeline, X, y, cv=10, seeds=seeds)
+    report(records)
+    return records
 
 
 def main():
@@ -1,14 +1,17 @@
 import os
+import sys
 import warnings
 import pandas as pd
 import numpy as np
 from collections import Counter
 
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import cross_val_score
 from imblearn.over_sampling import SVMSMOTE
 from imblearn.pipeline import Pipeline
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from evaluation import cross_evaluate, report
+
 warnings.filterwarnings('ignore')
 
 labelpath = "../../dataset/label_6166.csv"
@@ -29,14 +32,10 @@ def evaluate_model_cv(model, data, target, use_smote=False):
         model_name = type(model).__name__
 
     print(f"--- Evaluating {model_name} ---")
-    scoring_metrics = ['accuracy', 'precision', 'recall', 'f1', 'roc_auc']
-    for metric in scoring_metrics:
-        try:
-            scores = cross_val_score(pipeline, data, target, cv=10, scoring=metric, n_jobs=-1)
-            print(f"{metric.capitalize():<10}: {scores.mean():.4f} (+/- {scores.std():.4f})")
-        except Exception as e:
-            print(f"Could not calculate {metric}: {e}")
+    records = cross_evaluate(pipeline, data, target, cv=10)
+    report(records)
     print("-" * 40)
+    return records
 
 
 def train_noSmote(labelset, path1, path2):
@@ -1,16 +1,21 @@
 import pandas as pd
 import numpy as np
 from collections import Counter
+import os
+import sys
 import warnings
 
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import GridSearchCV, cross_val_score
+from sklearn.model_selection import GridSearchCV
 from sklearn.metrics import f1_score
 from imblearn.over_sampling import SVMSMOTE
 from imblearn.pipeline import Pipeline
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.impute import SimpleImputer
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from evaluation import cross_evaluate, report
+
 warnings.filterwarnings('ignore')
 
 TFIDF_PATH = "../../dataset/features/"
@@ -79,11 +84,10 @@ def run_fusion_model(sequence_feature_path, structure_feature_path):
     best_estimator = grid_search.best_estimator_
 
     print("\n--- Final Model Performance (Mean +/- Std Dev) ---")
-    scoring_metrics = ['accuracy', 'precision', 'recall', 'f1', 'roc_auc']
-    for metric in scoring_metrics:
-        scores = cross_val_score(best_estimator, data, target, cv=10, scoring=metric, n_jobs=-1)
-        print(f"{metric.capitalize():<10}: {scores.mean():.4f} (+/- {scores.std():.4f})")
+    records = cross_evaluate(best_estimator, data, target, cv=10)
+    report(records)
     print("\n")
+    return records
 
 
 def run_experiment_fixed_structure():
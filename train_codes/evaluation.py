@@ -0,0 +1,165 @@
+import os
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.metrics import f1_score, accuracy_score, precision_score, recall_score, roc_auc_score
+
+# Cross-validation engine shared by PonziFusion, RQ2 and RQ3.
+# Every (seed, fold) pair fits the pipeline once, all metrics come from the stored predictions and
+# scores of that fit, so 10 seeds x 10 folds cost 100 fits whatever the number of metrics.
+# The metrics are the functions behind the sklearn scorers of the same name, fed the same
+# responses (roc_auc takes decision_function and falls back to predict_proba, as its scorer
+# does), and failures follow cross_val_score(error_score=nan): a failed fit or score is NaN
+# and turns the mean into NaN, the metric is only lost when every fit of a run failed.
+
+SCORING = ['accuracy', 'precision', 'recall', 'f1', 'roc_auc']
+
+# metric: (function, takes a continuous score of the positive class instead of the prediction)
+METRICS = {
+    'accuracy': (accuracy_score, False),
+    'precision': (precision_score, False),
+    'recall': (recall_score, False),
+    'f1': (f1_score, False),
+    'roc_auc': (roc_auc_score, True),
+}
+
+_shared = {}
+
+
+def _init(estimator, X, y, scoring):
+    # the data goes to every worker once, tasks only carry fold indices
+    _shared.update(estimator=estimator, X=X, y=y, scoring=scoring)
+
+
+def _threshold(estimator, X):
+    # the roc_auc scorer prefers decision_function, predict_proba is the fallback
+    if hasattr(estimator, "decision_function"):
+        return estimator.decision_function(X)
+    # column of the positive class, as the roc_auc scorer takes it
+    return estimator.predict_proba(X)[:, 1]
+
+
+def _fold(task):
+    seed, fold, train, test = task
+    X, y = _shared["X"], _shared["y"]
+    estimator = clone(_shared["estimator"])
+    if seed is not None:
+        estimator.set_params(**{name: seed for name in estimator.get_params()
+                                if name == "random_state" or name.endswith("__random_state")})
+    start = time.perf_counter()
+    try:
+        estimator.fit(X[train], y[train])
+        failed = None
+    except Exception as e:
+        failed = e
+    record = {"seed": seed, "fold": fold, "fit_time": time.perf_counter() - start,
+              "fit_failed": failed is not None}
+    predictions = {}
+    for metric in _shared["scoring"]:
+        # a metric that cannot be calculated is NaN with its error, the other metrics still count
+        try:
+            if failed is not None:
+                raise failed
+            score, proba = METRICS[metric]
+            if proba not in predictions:
+                if proba:
+                    predictions[proba] = _threshold(estimator, X[test])
+                else:
+                    predictions[proba] = estimator.predict(X[test])
+            record[metric] = score(y[test], predictions[proba])
+        except Exception as e:
+            record[metric] = np.nan
+            record[metric + "_error"] = str(e)
+    return record
+
+
+def splits(y, cv=10, seed=None):
+    # without a seed the folds of cross_val_score(cv=n), with one StratifiedKFold shuffled by it
+    if seed is None:
+        splitter = StratifiedKFold(n_splits=cv)
+    else:
+        splitter = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    return list(splitter.split(np.zeros(len(y)), y))
+
+
+def cross_evaluate(estimator, X, y, cv=10, seeds=(None,), scoring=SCORING, workers=None):
+    """
+    Fit estimator once per (seed, fold) in a process pool and score every metric of scoring.
+    For a seed, every random_state parameter of the estimator (pipeline steps included) is set
+    to it and the folds are shuffled by it; None keeps the estimator and the unshuffled folds.
+    Returns one record per fold: seed, fold, fit_time, fit_failed and the metrics, a metric that
+    raised is NaN and its message is kept under metric + "_error".
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    tasks = [(seed, fold, train, test)
+             for seed in seeds for fold, (train, test) in enumerate(splits(y, cv, seed))]
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(tasks) > 1:
+        # one fold per process, nested jobs would fall back to one inside the pool anyway
+        estimator = clone(estimator).set_params(**{name: 1 for name in estimator.get_params()
+                                                   if name == "n_jobs" or name.endswith("__n_jobs")})
+        with Pool(min(workers, len(tasks)), initializer=_init, initargs=(estimator, X, y, scoring)) as pool:
+            return pool.map(_fold, tasks, 1)
+    _init(estimator, X, y, scoring)
+    return [_fold(task) for task in tasks]
+
+
+def summarize(records, scoring=SCORING):
+    """Mean over the folds of every seed, as cross_val_score(...).mean() gives it, one row per seed."""
+    table = pd.DataFrame(records)
+    return pd.DataFrame([{metric: group[metric].to_numpy().mean() for metric in scoring}
+                         for seed, group in table.groupby("seed", sort=False, dropna=False)])
+
+
+def report(records, scoring=SCORING):
+    # the mean +/- std lines the training scripts print, over the folds of a single run or over seeds
+    table = pd.DataFrame(records)
+    per_seed = table["seed"].nunique(dropna=False) > 1
+    scores = summarize(records, scoring) if per_seed else table
+    # cross_val_score only raises when every fit of a run failed
+    allfailed = table.groupby("seed", sort=False, dropna=False)["fit_failed"].all().any()
+    for metric in scoring:
+        error = metric + "_error"
+        failures = table[error].dropna() if error in table else pd.Series(dtype=object)
+        if allfailed:
+            print(f"Could not calculate {metric}: {failures.iloc[0]}")
+            continue
+        if len(failures):
+            # the NaN score cross_val_score warns about, the mean below is NaN as well
+            warnings.warn(f"{metric}: {len(failures)} of {len(table)} folds failed: {failures.iloc[0]}")
+        values = scores[metric].to_numpy()
+        print(f"{metric.capitalize():<10}: {values.mean():.4f} (+/- {values.std():.4f})")
+        if per_seed:
+            print(f"CV_Results_{metric}: {values.tolist()}")
+            print("-" * 40)
+
+
+def compare_cross_val_score(estimator, X, y, cv=10, seeds=(None,), scoring=SCORING, workers=None):
+    # cross_evaluate against one cross_val_score per seed and metric, the former evaluation loop
+    start = time.perf_counter()
+    records = cross_evaluate(estimator, X, y, cv, seeds, scoring, workers)
+    engine = time.perf_counter() - start
+    ours = summarize(records, scoring)
+
+    start = time.perf_counter()
+    expected = []
+    for seed in seeds:
+        model = clone(estimator)
+        folds = cv
+        if seed is not None:
+            model.set_params(**{name: seed for name in model.get_params()
+                                if name == "random_state" or name.endswith("__random_state")})
+            folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+        expected.append({metric: cross_val_score(model, X, y, cv=folds, scoring=metric, n_jobs=-1).mean()
+                         for metric in scoring})
+    former = time.perf_counter() - start
+    expected = pd.DataFrame(expected)
+
+    same = all((ours[metric].to_numpy() == expected[metric].to_numpy()).all() for metric in scoring)
+    print(f"identical: {same}, cross_evaluate {engine:.2f}s, cross_val_score per metric {former:.2f}s")
+    return same